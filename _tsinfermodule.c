@@ -249,7 +249,9 @@ AncestorBuilder_ancestor_descriptors(AncestorBuilder *self)
     if (AncestorBuilder_check_state(self) != 0) {
         goto out;
     }
+    Py_BEGIN_ALLOW_THREADS
     err = ancestor_builder_finalise(self->builder);
+    Py_END_ALLOW_THREADS
     if (err != 0) {
         handle_library_error(err);
         goto out;
@@ -1073,7 +1075,9 @@ TreeSequenceBuilder_freeze_indexes(TreeSequenceBuilder *self)
     int err;
     PyObject *ret = NULL;
 
+    Py_BEGIN_ALLOW_THREADS
     err = tree_sequence_builder_freeze_indexes(self->tree_sequence_builder);
+    Py_END_ALLOW_THREADS
     if (err != 0) {
         handle_library_error(err);
         goto out;
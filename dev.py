@@ -10,44 +10,38 @@ import tqdm
 
 import tsinfer
 
+try:
+    import orjson as _json
+except ImportError:
+    _json = json
+
 # import tskit
 
 
-def make_errors(v, p):
-    """
-    For each sample an error occurs with probability p. Errors are generated by
-    sampling values from the stationary distribution, that is, if we have an
-    allele frequency of f, a 1 is emitted with probability f and a
-    0 with probability 1 - f. Thus, there is a possibility that an 'error'
-    will in fact result in the same value.
-    """
-    w = np.copy(v)
-    if p > 0:
-        m = v.shape[0]
-        frequency = np.sum(v) / m
-        # Randomly choose samples with probability p
-        samples = np.where(np.random.random(m) < p)[0]
-        # Generate observations from the stationary distribution.
-        errors = (np.random.random(samples.shape[0]) < frequency).astype(int)
-        w[samples] = errors
-    return w
-
-
-def generate_samples(ts, error_p):
+def generate_samples(ts, error_p, rng):
     """
-    Returns samples with a bits flipped with a specified probability.
+    Returns samples with a bits flipped with a specified probability, using
+    the specified numpy Generator.
 
     Rejects any variants that result in a fixed column.
     """
-    S = np.zeros((ts.sample_size, ts.num_mutations), dtype=np.int8)
-    for variant in ts.variants():
-        done = False
-        # Reject any columns that have no 1s or no zeros
-        while not done:
-            S[:, variant.index] = make_errors(variant.genotypes, error_p)
-            s = np.sum(S[:, variant.index])
-            done = 0 < s < ts.sample_size
-    return S.T
+    G = ts.genotype_matrix().astype(np.int8, copy=False)
+    if error_p == 0:
+        # No errors can occur, so there is nothing to redraw.
+        return G
+    n = G.shape[1]
+    frequency = G.mean(axis=1, keepdims=True)
+    S = np.empty_like(G)
+    # Reject any sites that have no 1s or no zeros, redrawing only those rows.
+    redraw = np.arange(G.shape[0])
+    while redraw.shape[0] > 0:
+        shape = (redraw.shape[0], n)
+        mask = rng.random(shape) < error_p
+        errors = (rng.random(shape) < frequency[redraw]).astype(np.int8)
+        S[redraw] = np.where(mask, errors, G[redraw])
+        s = np.sum(S[redraw], axis=1)
+        redraw = redraw[(s == 0) | (s == n)]
+    return S
 
 
 def tsinfer_dev(
@@ -65,7 +59,7 @@ def tsinfer_dev(
     path_compression=True,
 ):
 
-    np.random.seed(seed)
+    rng = np.random.default_rng(seed)
     random.seed(seed)
     L_megabases = int(L * 10**6)
 
@@ -88,12 +82,14 @@ def tsinfer_dev(
 
     # samples = tsinfer.SampleData.from_tree_sequence(ts)
 
+    G = generate_samples(source_ts, error_rate, rng)
     with tsinfer.SampleData(sequence_length=source_ts.sequence_length) as samples:
         for var in source_ts.variants():
             # var.genotypes[var.site.id % source_ts.num_samples] = tskit.MISSING_DATA
-            samples.add_site(var.site.position, var.genotypes, var.alleles)
+            samples.add_site(var.site.position, G[var.site.id], var.alleles)
 
-    print(samples)
+    if debug:
+        print(samples)
     # for variant in samples.variants():
     #     print(variant)
 
@@ -112,12 +108,14 @@ def tsinfer_dev(
     ancestor_data = tsinfer.generate_ancestors(
         samples, engine=engine, num_threads=num_threads
     )
-    print(ancestor_data)
+    if debug:
+        print(ancestor_data)
 
     ancestors_ts = tsinfer.match_ancestors(
         samples,
         ancestor_data,
         engine=engine,
+        num_threads=num_threads,
         path_compression=True,
         extended_checks=False,
         precision=precision,
@@ -150,6 +148,7 @@ def tsinfer_dev(
         mismatch_ratio=mmr,
         path_compression=False,
         engine=engine,
+        num_threads=num_threads,
         precision=precision,
         simplify=False,
     )
@@ -178,8 +177,9 @@ def tsinfer_dev(
     # # print(ts.tables.edges)
     # print(ts.dump_tables())
 
-    # simplified = ts.simplify()
-    # print("edges before = ", simplified.num_edges)
+    # if debug:
+    #     simplified = ts.simplify()
+    #     print("edges before = ", simplified.num_edges)
 
     # new_ancestors_ts = insert_srb_ancestors(ts)
     # ts = tsinfer.match_samples(samples, new_ancestors_ts,
@@ -207,7 +207,7 @@ def dump_provenance(ts):
     for p in ts.provenances():
         print("-" * 50)
         print(p.timestamp)
-        pprint.pprint(json.loads(p.record))
+        pprint.pprint(_json.loads(p.record))
 
 
 def build_profile_inputs(n, num_megabases):
@@ -240,18 +240,18 @@ def build_profile_inputs(n, num_megabases):
         os.unlink(filename)
     # daiquiri.setup(level="DEBUG")
     with tsinfer.SampleData(
-        sequence_length=ts.sequence_length, path=filename, num_flush_threads=4
+        sequence_length=ts.sequence_length,
+        path=filename,
+        num_flush_threads=max(4, (os.cpu_count() or 1) // 2),
     ) as sample_data:
         # progress_monitor = tqdm.tqdm(total=ts.num_samples)
         # for j in range(ts.num_samples):
         #     sample_data.add_sample(metadata={"name": "sample_{}".format(j)})
         #     progress_monitor.update()
         # progress_monitor.close()
-        progress_monitor = tqdm.tqdm(total=ts.num_sites)
-        for variant in ts.variants():
+        variants = tqdm.tqdm(ts.variants(), total=ts.num_sites, miniters=1024)
+        for variant in variants:
             sample_data.add_site(variant.site.position, variant.genotypes)
-            progress_monitor.update()
-        progress_monitor.close()
 
     print(sample_data)
 
@@ -290,16 +290,13 @@ def tutorial_samples():
     ts.dump("tmp__NOBACKUP__/simulation-source.trees")
     print("simulation done:", ts.num_trees, "trees and", ts.num_sites, "sites")
 
-    progress = tqdm.tqdm(total=ts.num_sites)
     with tsinfer.SampleData(
         path="tmp__NOBACKUP__/simulation.samples",
         sequence_length=ts.sequence_length,
         num_flush_threads=2,
     ) as sample_data:
-        for var in ts.variants():
+        for var in tqdm.tqdm(ts.variants(), total=ts.num_sites, miniters=1024):
             sample_data.add_site(var.site.position, var.genotypes, var.alleles)
-            progress.update()
-    progress.close()
 
 
 def run_build():
@@ -333,7 +330,7 @@ if __name__ == "__main__":
         8,
         0.05,
         seed=4,
-        num_threads=0,
+        num_threads=os.cpu_count() or 1,
         engine="C",
         recombination_rate=1e-8,
         precision=0,
@@ -43,23 +43,27 @@ def save_figure(basename):
     plt.clf()
 
 
-def make_errors(v, p):
+def make_errors(v, p, rng):
     """
     For each sample an error occurs with probability p. Errors are generated by
     sampling values from the stationary distribution, that is, if we have an
     allele frequency of f, a 1 is emitted with probability f and a
     0 with probability 1 - f. Thus, there is a possibility that an 'error'
-    will in fact result in the same value.
+    will in fact result in the same value. Random values are drawn from the
+    specified numpy Generator.
+
+    If v is a (num_sites, num_samples) genotype matrix, errors are made in all
+    sites at once, using the allele frequency of each site.
     """
     w = np.copy(v)
     if p > 0:
-        m = v.shape[0]
-        frequency = np.sum(v) / m
-        # Randomly choose samples with probability p
-        samples = np.where(np.random.random(m) < p)[0]
-        # Generate observations from the stationary distribution.
-        errors = (np.random.random(samples.shape[0]) < frequency).astype(int)
-        w[samples] = errors
+        frequency = np.count_nonzero(v, axis=-1, keepdims=True) / v.shape[-1]
+        # Randomly choose samples with probability p. Given that u < p, u / p is
+        # uniform on [0, 1), so we reuse it to generate observations from the
+        # stationary distribution.
+        u = rng.random(v.shape)
+        samples = u < p
+        w[samples] = u[samples] / p < np.broadcast_to(frequency, v.shape)[samples]
     return w
 
 
@@ -109,19 +113,25 @@ def make_errors_genotype_model(g, error_probs):
     return np.array(sum(genos, ()))
 
 
-def generate_samples(ts, error_param=0):
+def generate_samples(ts, error_param=0, rng=None):
     """
     Generate a samples file from a simulated ts based on the empirically estimated
     error matrix saved in self.error_matrix.
     Reject any variants that result in a fixed column.
     """
     assert ts.num_sites != 0
+    if rng is None:
+        rng = np.random.default_rng()
     sd = tsinfer.SampleData(sequence_length=ts.sequence_length)
     try:
         e = float(error_param)
+        G = ts.genotype_matrix()
+        if e > 0:
+            G = make_errors(G, e, rng)
         for v in ts.variants():
-            g = v.genotypes if error_param == 0 else make_errors(v.genotypes, e)
-            sd.add_site(position=v.site.position, alleles=v.alleles, genotypes=g)
+            sd.add_site(
+                position=v.site.position, alleles=v.alleles, genotypes=G[v.site.id]
+            )
     except ValueError:
         error_matrix = pd.read_csv(error_param)
         # Error_param is not a number => is a error file
@@ -139,12 +149,18 @@ def generate_samples(ts, error_param=0):
 
 
 def run_infer(
-    ts, engine=tsinfer.C_ENGINE, path_compression=True, exact_ancestors=False
+    ts,
+    engine=tsinfer.C_ENGINE,
+    path_compression=True,
+    exact_ancestors=False,
+    sample_data=None,
 ):
     """
-    Runs the perfect inference process on the specified tree sequence.
+    Runs the perfect inference process on the specified tree sequence. If
+    sample_data is not specified it is created from the tree sequence.
     """
-    sample_data = tsinfer.SampleData.from_tree_sequence(ts)
+    if sample_data is None:
+        sample_data = tsinfer.SampleData.from_tree_sequence(ts)
 
     if exact_ancestors:
         ancestor_data = tsinfer.AncestorData(
@@ -164,6 +180,29 @@ def run_infer(
     return inferred_ts
 
 
+def edgeset_num_children(ts):
+    """
+    Returns the number of children in each of the edgesets of the specified
+    tree sequence, in the order of parent and left coordinate.
+    """
+    edges = ts.tables.edges
+    parent = np.concatenate([edges.parent, edges.parent])
+    position = np.concatenate([edges.left, edges.right])
+    delta = np.concatenate(
+        [np.ones(edges.num_rows, dtype=int), -np.ones(edges.num_rows, dtype=int)]
+    )
+    order = np.lexsort((position, parent))
+    parent = parent[order]
+    position = position[order]
+    first = np.ones(order.shape[0], dtype=bool)
+    first[1:] = (parent[1:] != parent[:-1]) | (position[1:] != position[:-1])
+    # The children of a parent change only at the ends of its edges. As the
+    # counts for each parent sum to zero, the running total over all parents is
+    # the number of children in the interval starting at each distinct point.
+    num_children = np.cumsum(np.add.reduceat(delta[order], np.flatnonzero(first)))
+    return num_children[num_children > 0]
+
+
 def edges_performance_worker(args):
     simulation_args, tree_metrics, engine = args
     before = time.perf_counter()
@@ -178,18 +217,12 @@ def edges_performance_worker(args):
     before = time.perf_counter()
     estimated_ancestors_ts = run_infer(smc_ts, exact_ancestors=False, engine=engine)
     estimated_ancestors_time = time.perf_counter() - before
-    num_children = []
-    for edgeset in estimated_ancestors_ts.edgesets():
-        num_children.append(len(edgeset.children))
-    estimated_ancestors_num_children = np.array(num_children)
+    estimated_ancestors_num_children = edgeset_num_children(estimated_ancestors_ts)
 
     before = time.perf_counter()
     exact_ancestors_ts = run_infer(smc_ts, exact_ancestors=True, engine=engine)
     exact_ancestors_time = time.perf_counter() - before
-    num_children = []
-    for edgeset in exact_ancestors_ts.edgesets():
-        num_children.append(len(edgeset.children))
-    exact_ancestors_num_children = np.array(num_children)
+    exact_ancestors_num_children = edgeset_num_children(exact_ancestors_ts)
 
     results = {
         "sim_time": sim_time,
@@ -478,15 +511,15 @@ def run_hotspot_analysis(args):
 
     num_bins = 100
     hotspot_breakpoints = breakpoints
+    inferred_breakpoints = inferred_ts.breakpoints(as_array=True)
+    source_breakpoints = ts.breakpoints(as_array=True)
 
     for density in [True, False]:
         for x in hotspot_breakpoints[1:-1]:
             plt.axvline(x=x, color="k", ls=":")
-        breakpoints = np.array(list(inferred_ts.breakpoints()))
-        v, bin_edges = np.histogram(breakpoints, num_bins, density=density)
+        v, bin_edges = np.histogram(inferred_breakpoints, num_bins, density=density)
         plt.plot(bin_edges[:-1], v, label="inferred")
-        breakpoints = np.array(list(ts.breakpoints()))
-        v, bin_edges = np.histogram(breakpoints, num_bins, density=density)
+        v, bin_edges = np.histogram(source_breakpoints, num_bins, density=density)
         plt.plot(bin_edges[:-1], v, label="source")
         plt.ylabel("Number of breakpoints")
         plt.legend()
@@ -770,7 +803,7 @@ def running_mean(x, N):
 def running_median(x, N):
     idx = np.arange(N) + np.arange(len(x) - N + 1)[:, None]
     b = [row[row > 0] for row in x[idx]]
-    return np.array(list(map(np.median, b)))
+    return np.fromiter(map(np.median, b), dtype=np.float64, count=len(b))
 
 
 class MidpointNormalize(mp.colors.Normalize):
@@ -820,7 +853,9 @@ def sim_true_and_inferred_ancestors(args):
     }
     ts = msprime.simulate(**sim_args)
 
-    sample_data = generate_samples(ts, args.error)
+    sample_data = generate_samples(
+        ts, args.error, rng=np.random.default_rng(args.random_seed)
+    )
 
     inferred_anc = tsinfer.generate_ancestors(sample_data, engine=args.engine)
     true_anc = tsinfer.AncestorData(
@@ -984,10 +1019,13 @@ def run_ancestor_comparison(args):
                 "const": 1,
             }
         ).sort_values(by=["time"])
-        sum_per_timeslice = df_all.groupby("time").sum().const.values
+        # df_all is sorted by time, so each timeslice is a contiguous run of
+        # x positions and its mean position is the midpoint of the run.
+        _, sum_per_timeslice = np.unique(df_all.time.values, return_counts=True)
         df_all["x_pos"] = range(df_all.shape[0])
         df_all["mean_x_pos"] = np.repeat(
-            df_all.groupby("time").mean().x_pos.values, sum_per_timeslice
+            np.cumsum(sum_per_timeslice) - (sum_per_timeslice + 1) / 2,
+            sum_per_timeslice,
         )
         df_all["width"] = np.repeat(sum_per_timeslice, sum_per_timeslice)
 
@@ -1155,22 +1193,40 @@ def run_ancestor_quality(args):
     )
 
     anc_indices = ancestor_data_by_pos(exact_anc, estim_anc)
-    shared_positions = np.array(list(sorted(anc_indices.keys())))
-    # append sequence_length to pos so that ancestors_end[:] indices are always valid
-    exact_positions = np.append(
-        exact_anc.sites_position[:], sample_data.sequence_length
-    )
-    estim_positions = np.append(
-        estim_anc.sites_position[:], sample_data.sequence_length
+    # Read the per-ancestor and per-site arrays once, rather than pulling the
+    # whole of each array out of the store for every ancestor below.
+    exact_sites_position = exact_anc.sites_position[:]
+    estim_sites_position = estim_anc.sites_position[:]
+    estim_anc_end = estim_anc.ancestors_end[:]
+    estim_anc_length = estim_anc.ancestors_length[:]
+    estim_anc_start = estim_anc.ancestors_start[:]
+    exact_anc_end = exact_anc.ancestors_end[:]
+    exact_anc_length = exact_anc.ancestors_length[:]
+    exact_anc_start = exact_anc.ancestors_start[:]
+    exact_anc_time = exact_anc.ancestors_time[:]
+    shared_positions = np.sort(
+        np.fromiter(anc_indices.keys(), dtype=np.float64, count=len(anc_indices))
     )
+    # append sequence_length to pos so that ancestors_end[:] indices are always valid
+    exact_positions = np.append(exact_sites_position, sample_data.sequence_length)
+    estim_positions = np.append(estim_sites_position, sample_data.sequence_length)
     # only include sites which are focal in both exact and estim in the genome-wise masks
-    exact_sites_mask = np.isin(exact_anc.sites_position[:], shared_positions)
-    estim_sites_mask = np.isin(estim_anc.sites_position[:], shared_positions)
+    exact_sites_mask = np.isin(exact_sites_position, shared_positions)
+    estim_sites_mask = np.isin(estim_sites_position, shared_positions)
     assert np.sum(exact_sites_mask) == np.sum(estim_sites_mask) == len(anc_indices)
 
     # store the data to plot for each focal_site, keyed by position
-    freq = {var.site.position: np.sum(var.genotypes) for var in sample_data.variants()}
-    estim_freq = np.array([freq[p] for p in estim_anc.sites_position], dtype=np.int64)
+    freq = dict(
+        zip(
+            sample_data.sites_position[:],
+            np.sum(sample_data.sites_genotypes[:], axis=1),
+        )
+    )
+    estim_freq = np.fromiter(
+        (freq[p] for p in estim_anc.sites_position),
+        dtype=np.int64,
+        count=estim_anc.num_sites,
+    )
     olap_n_sites = {}
     olap_n_should_be_1_higher_freq = {}
     olap_n_should_be_0_higher_freq = {}
@@ -1185,36 +1241,36 @@ def run_ancestor_quality(args):
     for i, focal_pos in enumerate(
         sorted(
             shared_positions,
-            key=lambda pos: -exact_anc.ancestors_time[:][anc_indices[pos][0]],
+            key=lambda pos: -exact_anc_time[anc_indices[pos][0]],
         )
     ):
         exact_index, estim_index = anc_indices[focal_pos]
         # left (start) is biggest of exact and estim
-        exact_start = exact_positions[exact_anc.ancestors_start[:][exact_index]]
-        estim_start = estim_positions[estim_anc.ancestors_start[:][estim_index]]
+        exact_start = exact_positions[exact_anc_start[exact_index]]
+        estim_start = estim_positions[estim_anc_start[estim_index]]
         if exact_start > estim_start:
-            olap_start_exact = exact_anc.ancestors_start[:][exact_index]
+            olap_start_exact = exact_anc_start[exact_index]
             olap_start = exact_positions[olap_start_exact]
-            olap_start_estim = np.searchsorted(estim_anc.sites_position[:], olap_start)
+            olap_start_estim = np.searchsorted(estim_sites_position, olap_start)
         else:
-            olap_start_estim = estim_anc.ancestors_start[:][estim_index]
+            olap_start_estim = estim_anc_start[estim_index]
             olap_start = estim_positions[olap_start_estim]
-            olap_start_exact = np.searchsorted(exact_anc.sites_position[:], olap_start)
+            olap_start_exact = np.searchsorted(exact_sites_position, olap_start)
 
         # right (end) is smallest of exact and estim
-        exact_end = exact_positions[exact_anc.ancestors_end[:][exact_index]]
-        estim_end = estim_positions[estim_anc.ancestors_end[:][estim_index]]
+        exact_end = exact_positions[exact_anc_end[exact_index]]
+        estim_end = estim_positions[estim_anc_end[estim_index]]
         if exact_end < estim_end:
-            olap_end_exact = exact_anc.ancestors_end[:][exact_index]
+            olap_end_exact = exact_anc_end[exact_index]
             olap_end = exact_positions[olap_end_exact]
-            olap_end_estim = np.searchsorted(estim_anc.sites_position[:], olap_end)
+            olap_end_estim = np.searchsorted(estim_sites_position, olap_end)
         else:
-            olap_end_estim = estim_anc.ancestors_end[:][estim_index]
+            olap_end_estim = estim_anc_end[estim_index]
             olap_end = estim_positions[olap_end_estim]
-            olap_end_exact = np.searchsorted(exact_anc.sites_position[:], olap_end)
+            olap_end_exact = np.searchsorted(exact_sites_position, olap_end)
 
-        offset1 = exact_anc.ancestors_start[:][exact_index]
-        offset2 = estim_anc.ancestors_start[:][estim_index]
+        offset1 = exact_anc_start[exact_index]
+        offset2 = estim_anc_start[estim_index]
 
         exact_full_hap = exact_anc.ancestors_full_haplotype[:, exact_index, 0]
         # slice the full haplotype to include only the overlapping region
@@ -1239,15 +1295,16 @@ def run_ancestor_quality(args):
         olap_n_sites[focal_pos] = len(exact_comp)
         olap_lft[focal_pos] = olap_start
         olap_rgt[focal_pos] = olap_end
-        true_len[focal_pos] = exact_anc.ancestors_length[:][exact_index]
-        est_len[focal_pos] = estim_anc.ancestors_length[:][estim_index]
-        true_time[focal_pos] = exact_anc.ancestors_time[:][exact_index]
+        true_len[focal_pos] = exact_anc_length[exact_index]
+        est_len[focal_pos] = estim_anc_length[estim_index]
+        true_time[focal_pos] = exact_anc_time[exact_index]
         sites_freq = estim_freq[olap_start_estim:olap_end_estim]
         higher_freq = sites_freq[small_estim_mask] > freq[focal_pos]
+        low_eq_freq = ~higher_freq
         olap_n_should_be_1_higher_freq[focal_pos] = np.sum(should_be_1 & higher_freq)
         olap_n_should_be_0_higher_freq[focal_pos] = np.sum(should_be_0 & higher_freq)
-        olap_n_should_be_1_low_eq_freq[focal_pos] = np.sum(should_be_1 & ~higher_freq)
-        olap_n_should_be_0_low_eq_freq[focal_pos] = np.sum(should_be_0 & ~higher_freq)
+        olap_n_should_be_1_low_eq_freq[focal_pos] = np.sum(should_be_1 & low_eq_freq)
+        olap_n_should_be_0_low_eq_freq[focal_pos] = np.sum(should_be_0 & low_eq_freq)
         assert olap_rgt[focal_pos] - olap_lft[focal_pos] <= true_len[focal_pos]
         assert olap_n_should_be_1_higher_freq[
             focal_pos
@@ -1271,8 +1328,8 @@ def run_ancestor_quality(args):
                     "#{} (pos {}, time_index = {}/{})".format(
                         i,
                         focal_pos,
-                        exact_anc.ancestors_time[:][exact_index],
-                        max(exact_anc.ancestors_time[:]),
+                        exact_anc_time[exact_index],
+                        max(exact_anc_time),
                     )
                 )
                 print(
@@ -1301,14 +1358,11 @@ def run_ancestor_quality(args):
                 print(" " * (olap_start_exact - offset1))
                 print(
                     "".join(
-                        [
-                            str(x)
-                            for x in np.where(
-                                exact_sites_mask[olap_start_exact:olap_end_exact],
-                                exact_olap,
-                                "*",
-                            )
-                        ]
+                        np.where(
+                            exact_sites_mask[olap_start_exact:olap_end_exact],
+                            exact_olap.astype(str),
+                            "*",
+                        )
                     )
                 )
                 print(f"INFERRED ANCESTOR for focal site #{i} (pos {focal_pos})")
@@ -1342,6 +1396,8 @@ def run_ancestor_quality(args):
                 print(" " * (olap_start_estim - offset2), end="")
             elif args.print_bad_ancestors == "inferred":
                 print(f"{int(freq[focal_pos]):<5}", end="")
+            # Build up the line and print it once, rather than per site
+            line = []
             k = 0
             mask = estim_sites_mask[olap_start_estim:olap_end_estim]
             for j, (bit, curr_pos) in enumerate(
@@ -1349,34 +1405,30 @@ def run_ancestor_quality(args):
             ):
                 if mask[j]:
                     if focal_pos == curr_pos:
-                        print(
+                        line.append(
                             colorama.Fore.WHITE
                             + colorama.Back.BLACK
                             + str(bit)
-                            + colorama.Style.RESET_ALL,
-                            end="",
+                            + colorama.Style.RESET_ALL
                         )
                     elif exact_comp[k] == bit:
-                        print(str(bit), end="")
+                        line.append(str(bit))
                     elif freq[focal_pos] < freq[curr_pos]:
-                        print(
-                            colorama.Back.RED + str(bit) + colorama.Style.RESET_ALL,
-                            end="",
+                        line.append(
+                            colorama.Back.RED + str(bit) + colorama.Style.RESET_ALL
                         )
                     elif freq[focal_pos] > freq[curr_pos]:
-                        print(
-                            colorama.Back.MAGENTA + str(bit) + colorama.Style.RESET_ALL,
-                            end="",
+                        line.append(
+                            colorama.Back.MAGENTA + str(bit) + colorama.Style.RESET_ALL
                         )
                     else:
-                        print(
-                            colorama.Back.YELLOW + str(bit) + colorama.Style.RESET_ALL,
-                            end="",
+                        line.append(
+                            colorama.Back.YELLOW + str(bit) + colorama.Style.RESET_ALL
                         )
                     k += 1
                 else:
-                    print("*", end="")
-            print(colorama.Style.RESET_ALL)
+                    line.append("*")
+            print("".join(line) + colorama.Style.RESET_ALL)
 
     # create the data for use, ordered by real time (and make a new time index)
     data = pd.DataFrame.from_records(
@@ -1586,12 +1638,12 @@ def run_ancestor_quality(args):
 
     name = "error-type-by-freq-mean-sem"
     # show the (weighted) average for different types of error
-    g = data[["err_hiF", "err_loF", "n_sites"]].groupby(data.Frequency)
+    g = data[["err_hiF", "err_loF", "n_sites"]].groupby(data.Frequency).sum()
     f_data = pd.DataFrame.from_dict(
         {
-            "Frequency": g.sum().index,
-            "hi": g.sum().err_hiF.values / g.sum().n_sites.values,
-            "lo": g.sum().err_loF.values / g.sum().n_sites.values,
+            "Frequency": g.index,
+            "hi": g.err_hiF.values / g.n_sites.values,
+            "lo": g.err_loF.values / g.n_sites.values,
         }
     )
     f_data = f_data.sort_values(by="Frequency")
@@ -1726,6 +1778,8 @@ def run_node_degree(args):
     smc_ts = msprime.simulate(**sim_args)
 
     engine = args.engine
+    # All four inferences below use the same samples.
+    sample_data = tsinfer.SampleData.from_tree_sequence(smc_ts)
     df = pd.DataFrame()
     for path_compression in [True, False]:
         estimated_ancestors_ts = run_infer(
@@ -1733,6 +1787,7 @@ def run_node_degree(args):
             engine=engine,
             exact_ancestors=False,
             path_compression=path_compression,
+            sample_data=sample_data,
         )
         degree, depth = get_node_degree_by_depth(estimated_ancestors_ts)
         df = df.append(
@@ -1750,6 +1805,7 @@ def run_node_degree(args):
             engine=engine,
             exact_ancestors=True,
             path_compression=path_compression,
+            sample_data=sample_data,
         )
         degree, depth = get_node_degree_by_depth(exact_ancestors_ts)
         df = df.append(
@@ -1803,55 +1859,66 @@ def multiple_recombinations(ts):
     return False
 
 
+def perfect_inference_worker(args):
+    sim_args, inference_args = args
+    base_ts = msprime.simulate(**sim_args)
+    print(
+        "simulated ts with n={} and {} trees; seed={}".format(
+            base_ts.num_samples, base_ts.num_trees, sim_args["random_seed"]
+        )
+    )
+    if not inference_args["use_ts"] and multiple_recombinations(base_ts):
+        print("Multiple recombinations; skipping")
+        return
+    ts, inferred_ts = tsinfer.run_perfect_inference(base_ts, **inference_args)
+    print(
+        "n={} num_trees={} num_sites={}".format(
+            ts.num_samples, ts.num_trees, ts.num_sites
+        )
+    )
+    assert ts.num_samples == inferred_ts.num_samples
+    assert ts.num_sites == inferred_ts.num_sites
+    if inference_args["path_compression"]:
+        _, distances = tsinfer.compare(ts, inferred_ts)
+        assert np.all(distances == 0)
+    else:
+        assert ts.tables.edges == inferred_ts.tables.edges
+        assert np.all(ts.tables.sites.position == inferred_ts.tables.sites.position)
+        assert ts.tables.mutations == inferred_ts.tables.mutations
+        assert np.array_equal(ts.tables.nodes.flags, inferred_ts.tables.nodes.flags)
+        assert np.any(ts.tables.nodes.time != inferred_ts.tables.nodes.time)
+
+
 def run_perfect_inference(args):
     model = "smc_prime"
     if args.use_ts:
         model = "hudson"
     rng = random.Random()
     rng.seed(args.random_seed)
+    inference_args = {
+        "num_threads": args.num_threads,
+        "engine": args.engine,
+        "extended_checks": args.extended_checks,
+        "time_chunking": not args.no_time_chunking,
+        "use_ts": args.use_ts,
+        "path_compression": args.path_compression,
+    }
+    work = []
     for _ in range(args.num_replicates):
-        seed = rng.randint(1, 2**30)
-        base_ts = msprime.simulate(
-            args.sample_size,
-            Ne=args.Ne,
-            length=args.length * 10**6,
-            recombination_rate=1e-8,
-            random_seed=seed,
-            model=model,
-        )
-        print(
-            "simulated ts with n={} and {} trees; seed={}".format(
-                base_ts.num_samples, base_ts.num_trees, seed
-            )
-        )
-        if not args.use_ts and multiple_recombinations(base_ts):
-            print("Multiple recombinations; skipping")
-            continue
-        ts, inferred_ts = tsinfer.run_perfect_inference(
-            base_ts,
-            num_threads=args.num_threads,
-            engine=args.engine,
-            extended_checks=args.extended_checks,
-            time_chunking=not args.no_time_chunking,
-            use_ts=args.use_ts,
-            path_compression=args.path_compression,
-        )
-        print(
-            "n={} num_trees={} num_sites={}".format(
-                ts.num_samples, ts.num_trees, ts.num_sites
-            )
-        )
-        assert ts.num_samples == inferred_ts.num_samples
-        assert ts.num_sites == inferred_ts.num_sites
-        if args.path_compression:
-            _, distances = tsinfer.compare(ts, inferred_ts)
-            assert np.all(distances == 0)
-        else:
-            assert ts.tables.edges == inferred_ts.tables.edges
-            assert np.all(ts.tables.sites.position == inferred_ts.tables.sites.position)
-            assert ts.tables.mutations == inferred_ts.tables.mutations
-            assert np.array_equal(ts.tables.nodes.flags, inferred_ts.tables.nodes.flags)
-            assert np.any(ts.tables.nodes.time != inferred_ts.tables.nodes.time)
+        sim_args = {
+            "sample_size": args.sample_size,
+            "Ne": args.Ne,
+            "length": args.length * 10**6,
+            "recombination_rate": 1e-8,
+            "random_seed": rng.randint(1, 2**30),
+            "model": model,
+        }
+        work.append((sim_args, inference_args))
+
+    # The replicates are independent, so run them in parallel.
+    with concurrent.futures.ProcessPoolExecutor(args.num_processes) as executor:
+        for _ in executor.map(perfect_inference_worker, work):
+            pass
 
 
 def setup_logging(args):
@@ -1959,6 +2026,7 @@ if __name__ == "__main__":
         action="store_true",
         help="Turn on path compression. Makes verification much slower.",
     )
+    add_worker_arguments(parser)
 
     #
     # Edges performance
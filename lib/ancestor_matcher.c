@@ -295,14 +295,21 @@ ancestor_matcher_update_site_likelihood_values(ancestor_matcher_t *self,
     const tsk_id_t *restrict L_nodes = self->likelihood_nodes;
     allele_t *restrict allelic_state = self->allelic_state;
     int8_t *restrict recombination_required = self->recombination_required;
-    int j;
-    tsk_id_t u, v, max_L_node;
-    double max_L, p_last, p_no_recomb, p_recomb, p_t, p_e;
+    tsk_id_t *restrict cached_nodes = self->likelihood_nodes_tmp;
+    int j, num_cached_nodes;
+    bool recombine;
+    tsk_id_t u, v, w, max_L_node;
+    double max_L, p_last, p_no_recomb, p_t, p_e;
     const double rho = self->recombination_rate[site];
     const double mu = self->mismatch_rate[site];
     const double n = (double) self->tree_sequence_builder->num_match_nodes;
     const double num_alleles
         = (double) self->tree_sequence_builder->sites.num_alleles[site];
+    /* The transition and emission terms only depend on the site, so compute
+     * them once rather than for every likelihood node. */
+    const double p_recomb = rho / n;
+    const double no_recomb_scale = 1 - rho + rho / n;
+    const double p_e_match = 1 - (num_alleles - 1) * mu;
 
     if (state >= num_alleles) {
         ret = TSI_ERR_BAD_HAPLOTYPE_ALLELE;
@@ -313,35 +320,31 @@ ancestor_matcher_update_site_likelihood_values(ancestor_matcher_t *self,
 
     max_L = -1;
     max_L_node = NULL_NODE;
+    num_cached_nodes = 0;
     assert(num_likelihood_nodes > 0);
     /* printf("likelihoods for node=%d, n=%d\n", mutation_node,
      * self->num_likelihood_nodes); */
     for (j = 0; j < num_likelihood_nodes; j++) {
         u = L_nodes[j];
-        /* Get the allelic state at u. */
-        /* TODO we can cache the states here to save some time. One nice way we could
-         * do the caching is to save the L_node index in the allelic_state array as
-         * we traverse upwards, and then keep an array of the L_node states which
-         * we then look up. This would save a second upward traversal to mark the
-         * array after we've found the state value. */
+        /* Get the allelic state at u, and cache it on the nodes along the path
+         * so that later upward traversals through them stop early. */
         v = u;
         while (allelic_state[v] == TSK_NULL) {
             v = parent[v];
         }
-        p_last = L[u];
-        p_no_recomb = p_last * (1 - rho + rho / n);
-        p_recomb = rho / n;
-        recombination_required[u] = false;
-        if (p_no_recomb > p_recomb) {
-            p_t = p_no_recomb;
-        } else {
-            p_t = p_recomb;
-            recombination_required[u] = true;
-        }
-        p_e = mu;
-        if (allelic_state[v] == state || state == TSK_MISSING_DATA) {
-            p_e = 1 - (num_alleles - 1) * mu;
+        for (w = u; w != v; w = parent[w]) {
+            allelic_state[w] = allelic_state[v];
+            cached_nodes[num_cached_nodes] = w;
+            num_cached_nodes++;
         }
+        p_last = L[u];
+        p_no_recomb = p_last * no_recomb_scale;
+        /* Written as selects rather than branches, as whether we recombine
+         * and whether the state matches are not predictable. */
+        recombine = !(p_no_recomb > p_recomb);
+        recombination_required[u] = (int8_t) recombine;
+        p_t = recombine ? p_recomb : p_no_recomb;
+        p_e = (allelic_state[v] == state || state == TSK_MISSING_DATA) ? p_e_match : mu;
         L[u] = p_t * p_e;
 
         if (L[u] > max_L) {
@@ -349,6 +352,9 @@ ancestor_matcher_update_site_likelihood_values(ancestor_matcher_t *self,
             max_L_node = u;
         }
     }
+    for (j = 0; j < num_cached_nodes; j++) {
+        allelic_state[cached_nodes[j]] = TSK_NULL;
+    }
     /* ancestor_matcher_print_state(self, stdout); */
     if (max_L <= 0) {
         if (mu <= 0 || mu >= 1) {
@@ -343,7 +343,10 @@ tree_sequence_builder_expand_nodes(tree_sequence_builder_t *self)
     int ret = 0;
     void *tmp;
 
-    self->max_nodes += self->nodes_chunk_size;
+    /* Grow geometrically so that the number of reallocs (and the matching
+     * reallocation of the ancestor matcher's per-node arrays) is logarithmic
+     * in the final number of nodes. */
+    self->max_nodes += TSK_MAX(self->nodes_chunk_size, self->max_nodes);
     tmp = realloc(self->time, self->max_nodes * sizeof(double));
     if (tmp == NULL) {
         ret = TSI_ERR_NO_MEMORY;
@@ -70,7 +70,9 @@ def pytest_collection_modifyitems(config, items):
 
 
 def num_nonsample_muts(ts):
-    return np.sum(np.logical_not(np.isin(ts.tables.mutations.node, ts.samples())))
+    return np.count_nonzero(
+        np.isin(ts.tables.mutations.node, ts.samples(), invert=True)
+    )
 
 
 def assign_individual_ids(ts):
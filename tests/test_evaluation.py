@@ -202,9 +202,12 @@ class TestGetAncestralHaplotypes:
         """
         A = np.full((ts.num_nodes, ts.num_sites), tskit.MISSING_DATA, dtype=np.int8)
         for t in ts.trees():
+            # All nodes in the tree are 0 at the tree's sites unless a mutation
+            # above them says otherwise.
+            nodes = np.fromiter(t.nodes(), dtype=int)
+            site_ids = np.array([site.id for site in t.sites()], dtype=int)
+            A[np.ix_(nodes, site_ids)] = 0
             for site in t.sites():
-                for u in t.nodes():
-                    A[u, site.id] = 0
                 for mutation in site.mutations:
                     # Every node underneath this node will have the value set
                     # at this site.
@@ -339,6 +342,15 @@ class TestGetAncestorDescriptors:
         ts = tsinfer.insert_perfect_mutations(ts)
         self.verify_single_tree_dense_mutations(ts)
 
+    @pytest.mark.parametrize("shape", [(0, 5), (3, 0), (0, 0)])
+    def test_empty(self, shape):
+        A = np.zeros(shape, dtype=np.int8)
+        ancestors, start, end, focal_sites = tsinfer.get_ancestor_descriptors(A)
+        assert np.array_equal(ancestors, np.zeros((1, shape[1]), dtype=np.int8))
+        assert start == [0]
+        assert end == [shape[1]]
+        assert focal_sites == [[]]
+
     def test_single_tree_random_mutations(self):
         ts = msprime.simulate(5, mutation_rate=5, random_seed=234)
         assert ts.num_sites > 1
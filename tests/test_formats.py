@@ -45,7 +45,7 @@ import tsinfer.formats as formats
 IS_WINDOWS = sys.platform == "win32"
 
 
-class ConvenienceFunctions:
+class TestConvenienceFunctions:
     """
     Tests for a couple of convenience functions at the top level of formats.py
     """
@@ -71,6 +71,23 @@ class ConvenienceFunctions:
         ]:
             assert not formats.np_obj_equal(obj_array, not_equal)
 
+    def test_np_ragged_equal(self):
+        def ragged(*items):
+            array = np.empty(len(items), dtype=object)
+            array[:] = [np.array(item, dtype=np.int32) for item in items]
+            return array
+
+        obj_array = ragged([1, 2], [], [3])
+        assert formats.np_ragged_equal(obj_array, ragged([1, 2], [], [3]))
+        assert formats.np_ragged_equal(ragged(), ragged())
+        for not_equal in [
+            ragged([1, 2], [3], []),
+            ragged([1], [2], [3]),
+            ragged([1, 2], [], [4]),
+            ragged([1, 2], []),
+        ]:
+            assert not formats.np_ragged_equal(obj_array, not_equal)
+
 
 class DataContainerMixin:
     """
@@ -737,6 +754,34 @@ class TestSampleData(DataContainerMixin):
         assert sample_data.individuals_metadata[0] == {"a": 1}
         assert sample_data.individuals_metadata[1] == {"b": 2}
 
+    def test_individual_read_cache(self):
+        sample_data = formats.SampleData(sequence_length=10)
+        sample_data.add_individual(ploidy=2, time=1, metadata={"a": 1})
+        sample_data.add_individual(ploidy=1, location=[0.5])
+        sample_data.add_site(0, [0, 0, 1])
+        sample_data.finalise()
+        ind = sample_data.individual(0)
+        assert ind.samples == [0, 1]
+        assert ind.time == 1
+        assert ind.metadata == {"a": 1}
+        ind = sample_data.individual(1)
+        assert ind.samples == [2]
+        assert ind.location == [0.5]
+        assert sample_data.sample(2).individual == 1
+        cached = sample_data._read_array("samples_individual")
+        assert cached is sample_data._read_array("samples_individual")
+        assert not cached.flags.writeable
+
+    def test_individual_metadata_not_shared(self):
+        sample_data = formats.SampleData(sequence_length=10)
+        sample_data.add_individual(ploidy=1, metadata={"a": [1]})
+        sample_data.add_site(0, [0])
+        sample_data.finalise()
+        ind = sample_data.individual(0)
+        ind.metadata["a"].append(2)
+        ind.metadata["b"] = 3
+        assert sample_data.individual(0).metadata == {"a": [1]}
+
     def test_add_individual_time(self):
         sample_data = formats.SampleData(sequence_length=10)
         sample_data.add_individual()
@@ -918,6 +963,22 @@ class TestSampleData(DataContainerMixin):
             j += 1
         assert j == ts.num_samples
 
+    @pytest.mark.parametrize("chunk_size", [1, 4, 5])
+    def test_all_haplotypes_multiple_chunks(self, chunk_size):
+        ts = tsutil.get_example_ts(13, random_seed=111)
+        input_file = formats.SampleData.from_tree_sequence(ts, chunk_size=chunk_size)
+        assert input_file.sites_genotypes.chunks[1] == chunk_size
+        G = ts.genotype_matrix()
+        haplotypes = list(input_file.haplotypes())
+        assert [index for index, _ in haplotypes] == list(range(ts.num_samples))
+        for index, h in haplotypes:
+            assert np.array_equal(h, G[:, index])
+        # Stopping part way through a chunk must not leave anything behind.
+        for index, h in input_file.haplotypes():
+            if index == chunk_size:
+                break
+        assert np.array_equal(h, G[:, chunk_size])
+
     def test_haplotypes_index_errors(self):
         ts = tsutil.get_example_ts(13, random_seed=19)
         assert ts.num_sites > 1
@@ -2578,6 +2639,46 @@ class BufferedItemWriterMixin:
             assert source_array.chunks == dest_array.chunks
         return dest
 
+    def verify_batch_round_trip(self, source, batch_size):
+        dest = {key: zarr.empty_like(array) for key, array in source.items()}
+        num_rows = next(iter(source.values())).shape[0]
+        writer = formats.BufferedItemWriter(dest, num_threads=self.num_threads)
+        for j in range(0, num_rows, batch_size):
+            batch = {key: array[j : j + batch_size] for key, array in source.items()}
+            assert writer.add_batch(**batch) == j
+        writer.flush()
+        for key, source_array in source.items():
+            assert np.array_equal(source_array[:], dest[key][:])
+
+    @pytest.mark.parametrize("batch_size", [1, 2, 3, 7, 10, 100])
+    def test_add_batch(self, batch_size):
+        source = {
+            "a": zarr.array(np.arange(50), chunks=(3,)),
+            "b": zarr.array(np.arange(100).reshape((50, 2)), chunks=(3, 2)),
+        }
+        self.verify_batch_round_trip(source, batch_size)
+
+    def test_reserve(self):
+        source = {
+            "a": zarr.array(np.arange(20), chunks=(3,)),
+            "b": zarr.array(np.arange(40).reshape((20, 2)), chunks=(3, 2)),
+        }
+        dest = {key: zarr.empty_like(array) for key, array in source.items()}
+        writer = formats.BufferedItemWriter(dest, num_threads=self.num_threads)
+        for j in range(20):
+            writer.reserve("b")[:] = source["b"][j]
+            assert writer.add(a=source["a"][j]) == j
+        writer.flush()
+        for key, source_array in source.items():
+            assert np.array_equal(source_array[:], dest[key][:])
+
+    def test_add_batch_unequal_lengths(self):
+        dest = {"a": zarr.zeros(10), "b": zarr.zeros(10)}
+        writer = formats.BufferedItemWriter(dest, num_threads=self.num_threads)
+        with pytest.raises(ValueError):
+            writer.add_batch(a=np.zeros(2), b=np.zeros(3))
+        writer.flush()
+
     def test_one_array(self):
         self.verify_round_trip({"a": zarr.ones(10)})
 
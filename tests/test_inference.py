@@ -3217,10 +3217,18 @@ class PathCompressionMixin:
     def verify_tree_sequence(self, ts):
         pc_nodes = [node for node in ts.nodes() if tsinfer.is_pc_ancestor(node.flags)]
         assert len(pc_nodes) > 0
+        # Group the edges by parent and by child so we can look them up per node.
+        edges = ts.tables.edges
+        by_parent = np.argsort(edges.parent, kind="stable")
+        by_child = np.argsort(edges.child, kind="stable")
+        sorted_parent = edges.parent[by_parent]
+        sorted_child = edges.child[by_child]
         for node in pc_nodes:
             # print("Synthetic node", node)
-            parent_edges = [edge for edge in ts.edges() if edge.parent == node.id]
-            child_edges = [edge for edge in ts.edges() if edge.child == node.id]
+            lo, hi = np.searchsorted(sorted_parent, [node.id, node.id + 1])
+            parent_edges = [ts.edge(j) for j in by_parent[lo:hi]]
+            lo, hi = np.searchsorted(sorted_child, [node.id, node.id + 1])
+            child_edges = [ts.edge(j) for j in by_child[lo:hi]]
             assert len(parent_edges) > 1
             assert len(child_edges) > 1
             child_edges.sort(key=lambda e: e.left)
@@ -3760,6 +3768,13 @@ class TestInsertSrbAncestors:
         ts = msprime.simulate(10, mutation_rate=5, recombination_rate=15, random_seed=2)
         self.verify(tsinfer.SampleData.from_tree_sequence(ts))
 
+    def test_show_progress_deprecated(self):
+        ts = msprime.simulate(10, mutation_rate=5, recombination_rate=15, random_seed=2)
+        samples = tsinfer.SampleData.from_tree_sequence(ts)
+        ts = tsinfer.infer(samples, simplify=False)
+        with pytest.warns(FutureWarning, match="show_progress"):
+            tsinfer.insert_srb_ancestors(samples, ts, show_progress=True)
+
     def test_random_data_small_examples(self):
         np.random.seed(4)
         num_random_tests = 10
@@ -28,6 +28,7 @@ first.
 import collections
 
 import attr
+import numba
 import numpy as np
 import sortedcontainers
 import tskit
@@ -678,6 +679,126 @@ COMPRESSED = -1
 NONZERO_ROOT = -2
 
 
+@numba.njit
+def _update_likelihoods(
+    likelihood_nodes,
+    likelihood,
+    allelic_state,
+    parent,
+    recombination_required,
+    rho,
+    mu,
+    n,
+    num_alleles,
+    haplotype_state,
+):
+    """
+    Updates the likelihoods of the specified nodes for a site with the specified
+    allelic states, recording whether each node requires a recombination.
+    Returns the maximum likelihood and the node that carries it.
+    """
+    max_L = -1.0
+    max_L_node = -1
+    for j in range(likelihood_nodes.shape[0]):
+        u = likelihood_nodes[j]
+        # Get the allelic_state at u. TODO we can cache these states to
+        # avoid some upward traversals.
+        v = u
+        while allelic_state[v] == -1:
+            v = parent[v]
+            assert v != -1
+
+        p_last = likelihood[u]
+        p_no_recomb = p_last * (1 - rho + rho / n)
+        p_recomb = rho / n
+        if p_no_recomb > p_recomb:
+            p_t = p_no_recomb
+        else:
+            p_t = p_recomb
+            recombination_required[j] = True
+        p_e = mu
+        if haplotype_state == tskit.MISSING_DATA or haplotype_state == allelic_state[v]:
+            p_e = 1 - (num_alleles - 1) * mu
+        likelihood[u] = p_t * p_e
+
+        if likelihood[u] > max_L:
+            max_L = likelihood[u]
+            max_L_node = u
+    return max_L, max_L_node
+
+
+@numba.njit
+def _round_half_away(x):
+    # The C library round(), which numba's round() does not follow.
+    z = np.floor(abs(x))
+    if abs(x) - z >= 0.5:
+        z += 1.0
+    return np.copysign(z, x)
+
+
+@numba.njit
+def _normalise_likelihoods(likelihood_nodes, likelihood, max_L, precision):
+    """
+    Divides the likelihoods of the specified nodes by max_L and rounds them to
+    the specified number of digits, in the same way as tsk_round in the C engine.
+    """
+    scale = 10.0**precision
+    for u in likelihood_nodes:
+        z = likelihood[u] / max_L
+        if precision < 22:
+            y = z * scale
+            z = _round_half_away(y)
+            if abs(y - z) == 0.5:
+                # halfway between two integers; use round-half-even
+                z = 2.0 * _round_half_away(y / 2.0)
+            z = z / scale
+        likelihood[u] = z
+
+
+@numba.njit
+def _compress_likelihoods(likelihood_nodes, likelihood, parent):
+    """
+    Removes the likelihood values for nodes that are equal to the likelihood
+    inherited from their parent, returning the remaining likelihood nodes.
+    """
+    L_cache = np.full(likelihood.shape[0], -1.0)
+    cached_paths = []
+    kept = np.empty_like(likelihood_nodes)
+    num_kept = 0
+    for u in likelihood_nodes:
+        # We need to find the likelihood of the parent of u. If this is
+        # the same as u, we can delete it.
+        p = parent[u]
+        if p != -1:
+            cached_paths.append(p)
+            v = p
+            while likelihood[v] == -1 and L_cache[v] == -1:
+                v = parent[v]
+            L_p = L_cache[v]
+            if L_p == -1:
+                L_p = likelihood[v]
+            # Fill in the L cache
+            v = p
+            while likelihood[v] == -1 and L_cache[v] == -1:
+                L_cache[v] = L_p
+                v = parent[v]
+
+            if likelihood[u] == L_p:
+                # Delete u from the map
+                likelihood[u] = -1
+        if likelihood[u] >= 0:
+            kept[num_kept] = u
+            num_kept += 1
+    # Reset the L cache
+    for u in cached_paths:
+        v = u
+        while v != -1 and L_cache[v] != -1:
+            L_cache[v] = -1
+            v = parent[v]
+    assert np.all(L_cache == -1)
+    return kept[:num_kept]
+
+
 class AncestorMatcher:
     def __init__(
         self,
@@ -770,34 +891,23 @@ class AncestorMatcher:
                 self.likelihood[node] = self.likelihood[u]
                 self.likelihood_nodes.append(node)
 
-        max_L = -1
-        max_L_node = -1
-        for u in self.likelihood_nodes:
-            # Get the allelic_state at u. TODO we can cache these states to
-            # avoid some upward traversals.
-            v = u
-            while self.allelic_state[v] == -1:
-                v = self.parent[v]
-                assert v != -1
-
-            p_last = self.likelihood[u]
-            p_no_recomb = p_last * (1 - rho + rho / n)
-            p_recomb = rho / n
-            recombination_required = False
-            if p_no_recomb > p_recomb:
-                p_t = p_no_recomb
-            else:
-                p_t = p_recomb
-                recombination_required = True
-            self.traceback[site][u] = recombination_required
-            p_e = mu
-            if haplotype_state in (tskit.MISSING_DATA, self.allelic_state[v]):
-                p_e = 1 - (num_alleles - 1) * mu
-            self.likelihood[u] = p_t * p_e
-
-            if self.likelihood[u] > max_L:
-                max_L = self.likelihood[u]
-                max_L_node = u
+        likelihood_nodes = np.array(self.likelihood_nodes, dtype=int)
+        recombination_required = np.zeros(len(likelihood_nodes), dtype=bool)
+        max_L, max_L_node = _update_likelihoods(
+            likelihood_nodes,
+            self.likelihood,
+            self.allelic_state,
+            self.parent,
+            recombination_required,
+            rho,
+            mu,
+            n,
+            num_alleles,
+            haplotype_state,
+        )
+        self.traceback[site] = dict(
+            zip(likelihood_nodes.tolist(), recombination_required.tolist())
+        )
 
         if max_L == 0:
             if mu == 0:
@@ -815,49 +925,17 @@ class AncestorMatcher:
                 )
             raise AssertionError("Unexpected matching failure")
 
-        for u in self.likelihood_nodes:
-            x = self.likelihood[u] / max_L
-            self.likelihood[u] = round(x, self.precision)
+        _normalise_likelihoods(likelihood_nodes, self.likelihood, max_L, self.precision)
 
         self.max_likelihood_node[site] = max_L_node
         self.unset_allelic_state(site)
         self.compress_likelihoods()
 
     def compress_likelihoods(self):
-        L_cache = np.zeros_like(self.likelihood) - 1
-        cached_paths = []
-        old_likelihood_nodes = list(self.likelihood_nodes)
-        self.likelihood_nodes.clear()
-        for u in old_likelihood_nodes:
-            # We need to find the likelihood of the parent of u. If this is
-            # the same as u, we can delete it.
-            if not self.is_root(u):
-                p = self.parent[u]
-                cached_paths.append(p)
-                v = p
-                while self.likelihood[v] == -1 and L_cache[v] == -1:
-                    v = self.parent[v]
-                L_p = L_cache[v]
-                if L_p == -1:
-                    L_p = self.likelihood[v]
-                # Fill in the L cache
-                v = p
-                while self.likelihood[v] == -1 and L_cache[v] == -1:
-                    L_cache[v] = L_p
-                    v = self.parent[v]
-
-                if self.likelihood[u] == L_p:
-                    # Delete u from the map
-                    self.likelihood[u] = -1
-            if self.likelihood[u] >= 0:
-                self.likelihood_nodes.append(u)
-        # Reset the L cache
-        for u in cached_paths:
-            v = u
-            while v != -1 and L_cache[v] != -1:
-                L_cache[v] = -1
-                v = self.parent[v]
-        assert np.all(L_cache == -1)
+        likelihood_nodes = _compress_likelihoods(
+            np.array(self.likelihood_nodes, dtype=int), self.likelihood, self.parent
+        )
+        self.likelihood_nodes[:] = likelihood_nodes.tolist()
 
     def remove_edge(self, edge):
         p = edge.parent
@@ -900,14 +978,14 @@ class AncestorMatcher:
         M = len(Il)
         n = self.tree_sequence_builder.num_nodes
         m = self.tree_sequence_builder.num_sites
-        self.parent = np.zeros(n, dtype=int) - 1
-        self.left_child = np.zeros(n, dtype=int) - 1
-        self.right_child = np.zeros(n, dtype=int) - 1
-        self.left_sib = np.zeros(n, dtype=int) - 1
-        self.right_sib = np.zeros(n, dtype=int) - 1
+        self.parent = np.full(n, -1, dtype=int)
+        self.left_child = np.full(n, -1, dtype=int)
+        self.right_child = np.full(n, -1, dtype=int)
+        self.left_sib = np.full(n, -1, dtype=int)
+        self.right_sib = np.full(n, -1, dtype=int)
         self.traceback = [{} for _ in range(m)]
-        self.max_likelihood_node = np.zeros(m, dtype=int) - 1
-        self.allelic_state = np.zeros(n, dtype=int) - 1
+        self.max_likelihood_node = np.full(m, -1, dtype=int)
+        self.allelic_state = np.full(n, -1, dtype=int)
 
         self.likelihood = np.full(n, NONZERO_ROOT, dtype=float)
         self.likelihood_nodes = []
@@ -1036,8 +1114,8 @@ class AncestorMatcher:
         u = self.max_likelihood_node[end - 1]
         output_edge = Edge(right=end, parent=u)
         output_edges = [output_edge]
-        recombination_required = (
-            np.zeros(self.tree_sequence_builder.num_nodes, dtype=int) - 1
+        recombination_required = np.full(
+            self.tree_sequence_builder.num_nodes, -1, dtype=int
         )
 
         # Now go back through the trees.
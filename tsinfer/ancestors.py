@@ -28,111 +28,139 @@ import numpy as np
 logger = logging.getLogger(__name__)
 
 
-def merge_overlapping_ancestors(start, end, time):
-    # Merge overlapping, same-time ancestors. We do this by scanning along a single
-    # time epoch from left to right, detecting breaks.
-    sort_indices = np.lexsort((start, time))
-    start = start[sort_indices]
-    end = end[sort_indices]
-    time = time[sort_indices]
-    old_indexes = {}
-    # For efficiency, pre-allocate the output arrays to the maximum possible size.
-    new_start = np.full_like(start, -1)
-    new_end = np.full_like(end, -1)
-    new_time = np.full_like(time, -1)
-
+@numba.njit
+def _find_overlap_groups(start, end, time):
+    # Scan along the ancestors (sorted by time and then start), detecting the breaks
+    # between groups of overlapping, same-time ancestors. Returns the index of the
+    # first ancestor in each group and the maximum end of each group.
+    n = len(start)
+    group_first = np.empty(n, dtype=np.int64)
+    group_end = np.empty_like(end)
+    num_groups = 0
     i = 0
-    new_index_pos = 0
-    while i < len(start):
+    while i < n:
         j = i + 1
-        group_overlap = [i]
         max_right = end[i]
         # While we're in the same time epoch, and the next ancestor
         # overlaps with the group, add this ancestor to the group.
-        while j < len(start) and time[j] == time[i] and start[j] < max_right:
+        while j < n and time[j] == time[i] and start[j] < max_right:
             max_right = max(max_right, end[j])
-            group_overlap.append(j)
             j += 1
-
-        # Emit the found group
-        old_indexes[new_index_pos] = group_overlap
-        new_start[new_index_pos] = start[i]
-        new_end[new_index_pos] = max_right
-        new_time[new_index_pos] = time[i]
-        new_index_pos += 1
+        group_first[num_groups] = i
+        group_end[num_groups] = max_right
+        num_groups += 1
         i = j
-    # Trim the output arrays to the actual size.
-    new_start = new_start[:new_index_pos]
-    new_end = new_end[:new_index_pos]
-    new_time = new_time[:new_index_pos]
-    return new_start, new_end, new_time, old_indexes, sort_indices
+    return group_first[:num_groups], group_end[:num_groups]
 
 
-@numba.njit
-def run_linesweep(event_times, event_index, event_type, new_time):
-    # Run the linesweep over the ancestor start-stop events,
-    # building up the dependency graph as a count of dependencies for each ancestor,
-    # and a list of dependant children for each ancestor.
-    n = len(new_time)
-
-    # numba really likes to know the type of the list elements, so we tell it by adding
-    # a dummy element to the list and then popping it off.
-    # `active` is the list of ancestors that overlap with the current linesweep position.
-    active = [-1]
-    active.pop()
-    children = [[-1] for _ in range(n)]
-    for c in range(n):
-        children[c].pop()
-    incoming_edge_count = np.zeros(n, dtype=np.int32)
-    for i in range(len(event_times)):
-        index = event_index[i]
-        e_time = event_times[i]
-        if event_type[i] == 1:
-            for j in active:
-                if new_time[j] > e_time:
-                    incoming_edge_count[index] += 1
-                    children[j].append(index)
-                elif new_time[j] < e_time:
-                    incoming_edge_count[j] += 1
-                    children[index].append(j)
-            active.append(index)
-        else:
-            active.remove(index)
-
-    # Convert children to ragged array format so we can pass arrays to the
-    # next numba function, `find_groups`.
-    children_data = []
-    children_indices = [0]
-    for child_list in children:
-        children_data.extend(child_list)
-        children_indices.append(len(children_data))
-    children_data = np.array(children_data, dtype=np.int32)
-    children_indices = np.array(children_indices, dtype=np.int32)
-    return children_data, children_indices, incoming_edge_count
+def _merge_overlapping_ancestors(start, end, time):
+    # Merge overlapping, same-time ancestors. We do this by scanning along a single
+    # time epoch from left to right, detecting breaks. Each merged ancestor is a
+    # contiguous run of the sorted ancestors, and we return the index of the first.
+    sort_indices = np.lexsort((start, time))
+    start = start[sort_indices]
+    end = end[sort_indices]
+    time = time[sort_indices]
+    group_first, new_end = _find_overlap_groups(start, end, time)
+    new_start = start[group_first]
+    new_time = time[group_first]
+    return new_start, new_end, new_time, group_first, sort_indices
+
+
+def merge_overlapping_ancestors(start, end, time):
+    (
+        new_start,
+        new_end,
+        new_time,
+        group_first,
+        sort_indices,
+    ) = _merge_overlapping_ancestors(start, end, time)
+    bounds = np.append(group_first, len(start)).tolist()
+    old_indexes = {
+        j: list(range(bounds[j], bounds[j + 1])) for j in range(len(group_first))
+    }
+    return new_start, new_end, new_time, old_indexes, sort_indices
 
 
 @numba.njit
-def find_groups(children_data, children_indices, incoming_edge_count):
-    # We find groups of ancestors that can be matched in parallel by topologically
-    # sorting the dependency graph. We do this by deconstructing the graph, removing
-    # nodes with no incoming edges, and adding them to a group.
-    n = len(children_indices) - 1
+def find_groups(start, end, time):
+    # We find groups of ancestors that can be matched in parallel. An ancestor
+    # depends on all older ancestors that overlap with it, and its group is the
+    # length of the longest chain of such dependencies (i.e., the level in a
+    # topological sort of the dependency graph). Rather than building the graph
+    # explicitly, we sweep through the ancestors from oldest to youngest,
+    # keeping a segment tree over the (compressed) coordinates that records
+    # the maximum group of the ancestors inserted so far over each interval.
+    n = len(time)
     group_id = np.full(n, -1, dtype=np.int32)
-    current_group = 0
-    while True:
-        # Find the nodes with no incoming edges
-        no_incoming = np.where(incoming_edge_count == 0)[0]
-        if len(no_incoming) == 0:
-            break
-        # Remove them from the graph
-        for i in no_incoming:
-            incoming_edge_count[i] = -1
-            incoming_edge_count[
-                children_data[children_indices[i] : children_indices[i + 1]]
-            ] -= 1
-        # Add them to the group
-        group_id[no_incoming] = current_group
-        current_group += 1
+    if n == 0:
+        return group_id
+    coords = np.unique(np.concatenate((start, end)))
+    left = np.searchsorted(coords, start)
+    right = np.searchsorted(coords, end)
+    size = 1
+    while size < len(coords):
+        size *= 2
+    # The max group over all positions under a node, and the max group of the
+    # ancestors that cover the whole of a node.
+    subtree_max = np.full(2 * size, -1, dtype=np.int32)
+    covering_max = np.full(2 * size, -1, dtype=np.int32)
+    order = np.argsort(-time, kind="mergesort")
+    i = 0
+    while i < n:
+        # Ancestors of the same age don't depend on each other, so find the
+        # groups of the whole epoch before inserting any of them.
+        j = i
+        while j < n and time[order[j]] == time[order[i]]:
+            j += 1
+        for k in range(i, j):
+            u = order[k]
+            lo = left[u] + size
+            hi = right[u] + size
+            value = -1
+            x = lo >> 1
+            while x > 0:
+                value = max(value, covering_max[x])
+                x >>= 1
+            x = (hi - 1) >> 1
+            while x > 0:
+                value = max(value, covering_max[x])
+                x >>= 1
+            while lo < hi:
+                if lo & 1:
+                    value = max(value, subtree_max[lo])
+                    lo += 1
+                if hi & 1:
+                    hi -= 1
+                    value = max(value, subtree_max[hi])
+                lo >>= 1
+                hi >>= 1
+            group_id[u] = value + 1
+        for k in range(i, j):
+            u = order[k]
+            value = group_id[u]
+            lo = left[u] + size
+            hi = right[u] + size
+            x = lo >> 1
+            while x > 0:
+                subtree_max[x] = max(subtree_max[x], value)
+                x >>= 1
+            x = (hi - 1) >> 1
+            while x > 0:
+                subtree_max[x] = max(subtree_max[x], value)
+                x >>= 1
+            while lo < hi:
+                if lo & 1:
+                    covering_max[lo] = max(covering_max[lo], value)
+                    subtree_max[lo] = max(subtree_max[lo], value)
+                    lo += 1
+                if hi & 1:
+                    hi -= 1
+                    covering_max[hi] = max(covering_max[hi], value)
+                    subtree_max[hi] = max(subtree_max[hi], value)
+                lo >>= 1
+                hi >>= 1
+        i = j
     return group_id
 
 
@@ -141,9 +169,9 @@ def group_ancestors_by_linesweep(start, end, time):
     # For each ancestor, any overlapping, older ancestors must be in an earlier group,
     # and any overlapping, younger ancestors in a later group. Any overlapping same-age
     # ancestors must be in the same group so they don't match to each other.
-    # We do this by first merging the overlapping same-age ancestors. Then build a
-    # dependency graph of the ancestors by linesweep. Then form groups by topological
-    # sort. Finally, we un-merge the same-age ancestors.
+    # We do this by first merging the overlapping same-age ancestors. Then find the
+    # topological level of each ancestor in the dependency graph by linesweep, which
+    # gives its group. Finally, we un-merge the same-age ancestors.
 
     assert len(start) == len(end)
     assert len(start) == len(time)
@@ -152,55 +180,28 @@ def group_ancestors_by_linesweep(start, end, time):
         new_start,
         new_end,
         new_time,
-        old_indexes,
+        group_first,
         sort_indices,
-    ) = merge_overlapping_ancestors(start, end, time)
+    ) = _merge_overlapping_ancestors(start, end, time)
     logger.info(f"Merged to {len(new_start)} ancestors in {time_.time() - t:.2f}s")
 
-    # Build a list of events for the linesweep
-    t = time_.time()
-    n = len(new_time)
-    # Create events arrays by copying and concatenating inputs
-    event_times = np.concatenate([new_time, new_time])
-    event_pos = np.concatenate([new_start, new_end])
-    event_index = np.concatenate([np.arange(n), np.arange(n)])
-    event_type = np.concatenate([np.ones(n, dtype=np.int8), np.zeros(n, dtype=np.int8)])
-    # Sort events by position, then ends before starts
-    event_sort_indices = np.lexsort((event_type, event_pos))
-    event_times = event_times[event_sort_indices]
-    event_index = event_index[event_sort_indices]
-    event_type = event_type[event_sort_indices]
-    logger.info(f"Built {len(event_times)} events in {time_.time() - t:.2f}s")
-
     t = time_.time()
-    children_data, children_indices, incoming_edge_count = run_linesweep(
-        event_times, event_index, event_type, new_time
-    )
-    logger.info(
-        f"Linesweep generated {np.sum(incoming_edge_count)} dependencies in"
-        f" {time_.time() - t:.2f}s"
-    )
-
-    t = time_.time()
-    group_id = find_groups(children_data, children_indices, incoming_edge_count)
+    group_id = find_groups(new_start, new_end, new_time)
     logger.info(f"Found groups in {time_.time() - t:.2f}s")
 
     t = time_.time()
-    # Convert the group id array to lists of ids for each group
+    # Un-merge the same-age ancestors, simultaneously mapping back to the original,
+    # unsorted indexes. Each merged ancestor is a run of consecutive sorted ancestors.
+    merged_size = np.diff(np.append(group_first, len(start)))
+    original_group_id = np.empty(len(start), dtype=np.int32)
+    original_group_id[sort_indices] = np.repeat(group_id, merged_size)
+
+    # Convert the group id array to sorted lists of ids for each group
     ancestor_grouping = {}
-    for group in np.unique(group_id):
-        ancestor_grouping[group] = np.where(group_id == group)[0]
-
-    # Now un-merge the same-age ancestors, simultaneously mapping back to the original,
-    # unsorted indexes
-    for group in ancestor_grouping:
-        ancestor_grouping[group] = sorted(
-            [
-                sort_indices[item]
-                for i in ancestor_grouping[group]
-                for item in old_indexes[i]
-            ]
-        )
+    order = np.argsort(original_group_id, kind="stable")
+    groups, group_start = np.unique(original_group_id[order], return_index=True)
+    for group, ids in zip(groups, np.split(order, group_start[1:])):
+        ancestor_grouping[group] = ids.tolist()
     logger.info(f"Un-merged in {time_.time() - t:.2f}s")
     logger.info(
         f"{len(ancestor_grouping)} groups with median size "
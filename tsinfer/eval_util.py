@@ -18,12 +18,13 @@
 """
 Tools for evaluating the algorithm.
 """
-import bisect
 import collections
 import json
 import logging
 import random
+import warnings
 
+import numba
 import numpy as np
 import tqdm
 import tskit
@@ -36,6 +37,25 @@ import tsinfer.provenance as provenance
 logger = logging.getLogger(__name__)
 
 
+@numba.njit
+def _descendants(u, left_child, right_sib):
+    # Depth-first traversal of the subtree below u using an explicit stack.
+    below = np.zeros(left_child.shape[0], dtype=np.bool_)
+    stack = np.empty(left_child.shape[0], dtype=np.int32)
+    stack[0] = u
+    size = 1
+    while size > 0:
+        size -= 1
+        v = stack[size]
+        below[v] = True
+        c = left_child[v]
+        while c != -1:
+            stack[size] = c
+            size += 1
+            c = right_sib[c]
+    return below
+
+
 def insert_errors(ts, probability, seed=None):
     """
     Each site has a probability p of generating an error. Errors
@@ -57,6 +77,8 @@ def insert_errors(ts, probability, seed=None):
             tables.mutations.add_row(
                 site=site.id, node=mutation_node, derived_state="1"
             )
+            # Only walk the subtree if an error actually lands at this site.
+            below = None
             for sample in samples:
                 # We disallow any fixations. There are two possibilities:
                 # (1) We have a singleton and the sample
@@ -71,12 +93,13 @@ def insert_errors(ts, probability, seed=None):
                 if rng.random() < probability:
                     # If sample is a descendent of the mutation node we
                     # change the state to 0, otherwise change state to 1.
-                    u = sample
-                    while u != mutation_node and u != tskit.NULL:
-                        u = tree.parent(u)
-                    derived_state = str(int(u == tskit.NULL))
+                    if below is None:
+                        below = _descendants(
+                            mutation_node, tree.left_child_array, tree.right_sib_array
+                        )
+                    derived_state = str(int(not below[sample]))
                     parent = tskit.NULL
-                    if u == tskit.NULL:
+                    if not below[sample]:
                         parent = len(tables.mutations) - 1
                     tables.mutations.add_row(
                         site=site.id,
@@ -153,7 +176,7 @@ def insert_perfect_mutations(ts, delta=None):
     tables.mutations.clear()
 
     num_children = np.zeros(ts.num_nodes, dtype=int)
-    parent = np.zeros(ts.num_nodes, dtype=int) - 1
+    parent = np.full(ts.num_nodes, -1, dtype=int)
 
     current_delta = 0
     if delta is not None:
@@ -228,16 +251,35 @@ def get_ancestral_haplotypes(ts):
 
     sites = tables.sites.position
     tsp = tables.tree_sequence()
-    B = tsp.genotype_matrix().T
-
-    A = np.full((ts.num_nodes, ts.num_sites), tskit.MISSING_DATA, dtype=np.int8)
-    for edge in ts.edges():
-        start = bisect.bisect_left(sites, edge.left)
-        end = bisect.bisect_right(sites, edge.right)
-        if sites[end - 1] == edge.right:
-            end -= 1
-        A[edge.parent, start:end] = B[edge.parent, start:end]
-    A[: ts.num_samples] = B[: ts.num_samples]
+    A = np.ascontiguousarray(tsp.genotype_matrix().T, dtype=np.int8)
+
+    # Merge the site intervals of each parent's edges into disjoint runs. Offsetting
+    # the intervals by parent * stride lets us sort and take the running maximum of
+    # the ends over all parents at once, as runs cannot cross between parents.
+    edges = tables.edges
+    stride = ts.num_sites + 1
+    offset = edges.parent.astype(np.int64) * stride
+    start = np.searchsorted(sites, edges.left) + offset
+    end = np.searchsorted(sites, edges.right) + offset
+    keep = start < end
+    order = np.argsort(start[keep], kind="stable")
+    start = start[keep][order]
+    end = np.maximum.accumulate(end[keep][order])
+    run_start = np.ones(start.shape[0], dtype=bool)
+    run_start[1:] = start[1:] > end[:-1]
+    run_end = np.ones_like(run_start)
+    run_end[:-1] = run_start[1:]
+
+    # As the runs are disjoint, the cumulative sum of the +1/-1 run boundaries
+    # along each row is 1 for covered sites and 0 otherwise.
+    covered = np.zeros(ts.num_nodes * stride, dtype=np.int8)
+    covered[start[run_start]] = 1
+    covered[end[run_end]] = -1
+    covered = covered.reshape(ts.num_nodes, stride)
+    np.cumsum(covered, axis=1, out=covered)
+    missing = covered[:, :-1] == 0
+    missing[: ts.num_samples] = False
+    A[missing] = tskit.MISSING_DATA
     return A
 
 
@@ -253,32 +295,33 @@ def get_ancestor_descriptors(A):
     results on ancestors that contain trapped genetic material.
     """
     L = A.shape[1]
-    ancestors = [np.zeros(L, dtype=np.int8)]
-    focal_sites = [[]]
-    start = [0]
-    end = [L]
-    # ancestors = []
-    # focal_sites = []
-    # start = []
-    # end = []
-    mask = np.ones(L)
-    for a in A:
-        masked = np.logical_and(a == 1, mask).astype(int)
-        new_sites = np.where(masked)[0]
-        mask[new_sites] = 0
-        segment = np.where(a != tskit.MISSING_DATA)[0]
-        # Skip any ancestors that are entirely unknown
-        if segment.shape[0] > 0:
-            s = segment[0]
-            e = segment[-1] + 1
-            assert np.all(a[s:e] != tskit.MISSING_DATA)
-            assert np.all(a[:s] == tskit.MISSING_DATA)
-            assert np.all(a[e:] == tskit.MISSING_DATA)
-            ancestors.append(a)
-            focal_sites.append(new_sites)
-            start.append(s)
-            end.append(e)
-    return np.array(ancestors, dtype=np.int8), start, end, focal_sites
+    if A.shape[0] == 0 or L == 0:
+        # No ancestor can have any known sites, so only the root is returned.
+        return np.zeros((1, L), dtype=np.int8), [0], [L], [[]]
+    # Each site is focal for the first ancestor that carries the derived state.
+    derived = A == 1
+    has_derived = np.flatnonzero(np.any(derived, axis=0))
+    first = np.argmax(derived, axis=0)[has_derived]
+    order = np.argsort(first, kind="stable")
+    focal_row, focal_index = np.unique(first[order], return_index=True)
+    new_sites = np.split(has_derived[order], focal_index[1:])
+
+    known = A != tskit.MISSING_DATA
+    num_known = np.sum(known, axis=1)
+    # Skip any ancestors that are entirely unknown
+    rows = np.flatnonzero(num_known > 0)
+    s = np.argmax(known[rows], axis=1)
+    e = L - np.argmax(known[rows, ::-1], axis=1)
+    assert np.all(e - s == num_known[rows])
+
+    ancestors = np.zeros((rows.shape[0] + 1, L), dtype=np.int8)
+    np.take(A, rows, axis=0, out=ancestors[1:])
+    focal_sites = [[]] + [np.array([], dtype=np.int64) for _ in rows]
+    for row, sites in zip(np.searchsorted(rows, focal_row), new_sites):
+        focal_sites[row + 1] = sites
+    start = [0] + s.tolist()
+    end = [L] + e.tolist()
+    return ancestors, start, end, focal_sites
 
 
 def assert_smc(ts):
@@ -309,6 +352,23 @@ def assert_single_recombination(ts):
             raise ValueError("Multiple recombinations at ", e.right)
 
 
+@numba.njit
+def _chunk_times(start, end, num_sites):
+    # Give ancestors the same time until one overlaps an earlier one in the chunk.
+    time = np.zeros(start.shape[0])
+    intersect_mask = np.zeros(num_sites, dtype=np.bool_)
+    t = 0
+    for j in range(start.shape[0]):
+        for k in range(start[j], end[j]):
+            if intersect_mask[k]:
+                t += 1
+                intersect_mask[:] = False
+                break
+        intersect_mask[start[j] : end[j]] = True
+        time[j] = t
+    return time
+
+
 def build_simulated_ancestors(sample_data, ancestor_data, ts, time_chunking=False):
     # Any non-smc tree sequences are rejected.
     assert_smc(ts)
@@ -322,15 +382,9 @@ def build_simulated_ancestors(sample_data, ancestor_data, ts, time_chunking=Fals
     ancestors, start, end, focal_sites = get_ancestor_descriptors(A)
     N = len(ancestors)
     if time_chunking:
-        time = np.zeros(N)
-        intersect_mask = np.zeros(A.shape[1], dtype=int)
-        t = 0
-        for j in range(N):
-            if np.any(intersect_mask[start[j] : end[j]] == 1):
-                t += 1
-                intersect_mask[:] = 0
-            intersect_mask[start[j] : end[j]] = 1
-            time[j] = t
+        time = _chunk_times(
+            np.array(start, dtype=np.int64), np.array(end, dtype=np.int64), A.shape[1]
+        )
     else:
         time = np.arange(N)
     time = -1 * (time - time[-1]) + 1
@@ -394,7 +448,7 @@ def subset_sites(ts, position, **kwargs):
     Return a copy of the specified tree sequence with sites reduced to those
     with positions in the specified list.
     """
-    to_delete = np.where(np.logical_not(np.isin(ts.sites_position, position)))[0]
+    to_delete = np.flatnonzero(np.isin(ts.sites_position, position, invert=True))
     return ts.delete_sites(to_delete, **kwargs)
 
 
@@ -496,12 +550,17 @@ def get_tsinfer_inference_sites(ts):
     Returns the list of site positions from the specified tsinfer generated
     tree sequence that were used as inference sites.
     """
-    positions = []
-    for site in ts.sites():
-        md = json.loads(site.metadata)
-        if md["inference_type"] == constants.INFERENCE_FULL:
-            positions.append(site.position)
-    return np.array(positions)
+    sites = ts.tables.sites
+    metadata = tskit.unpack_bytes(sites.metadata, sites.metadata_offset)
+    is_full = np.fromiter(
+        (
+            json.loads(md)["inference_type"] == constants.INFERENCE_FULL
+            for md in metadata
+        ),
+        dtype=bool,
+        count=len(metadata),
+    )
+    return sites.position[is_full]
 
 
 def extract_ancestors(samples, ts):
@@ -518,16 +577,8 @@ def extract_ancestors(samples, ts):
     # has been marked as samples.
     samples = np.where(tables.nodes.flags != tskit.NODE_IS_SAMPLE)[0].astype(np.int32)
 
-    # Mark all nodes as samples
-    tables.nodes.set_columns(
-        flags=np.bitwise_or(tables.nodes.flags, tskit.NODE_IS_SAMPLE),
-        time=tables.nodes.time,
-        population=tables.nodes.population,
-        individual=tables.nodes.individual,
-        metadata=tables.nodes.metadata,
-        metadata_offset=tables.nodes.metadata_offset,
-    )
-    # Now simplify down the tables to get rid of all sample edges.
+    # Simplify down the tables to get rid of all sample edges. This marks all
+    # the retained nodes as samples.
     node_id_map = tables.simplify(
         samples,
         filter_sites=False,
@@ -538,19 +589,11 @@ def extract_ancestors(samples, ts):
 
     # We cannot have flags that are both samples and have other flags set,
     # so we need to unset all the sample flags for these.
-    flags = np.zeros_like(tables.nodes.flags)
-    index = tables.nodes.flags == tskit.NODE_IS_SAMPLE
-    flags[index] = tskit.NODE_IS_SAMPLE
-    index = tables.nodes.flags != tskit.NODE_IS_SAMPLE
-    flags[index] = np.bitwise_and(tables.nodes.flags[index], ~tskit.NODE_IS_SAMPLE)
-
-    tables.nodes.set_columns(
-        flags=flags,
-        time=tables.nodes.time,
-        population=tables.nodes.population,
-        individual=tables.nodes.individual,
-        metadata=tables.nodes.metadata,
-        metadata_offset=tables.nodes.metadata_offset,
+    flags = tables.nodes.flags
+    tables.nodes.flags = np.where(
+        flags == tskit.NODE_IS_SAMPLE,
+        flags,
+        flags & ~np.uint32(tskit.NODE_IS_SAMPLE),
     )
 
     record = provenance.get_provenance_dict(command="extract_ancestors")
@@ -559,75 +602,105 @@ def extract_ancestors(samples, ts):
     return tables, node_id_map
 
 
+@numba.njit
+def _srb_bounds(key_index, left, right, num_keys):
+    # Intersect the spans of all edge pairs that map to the same SRB key.
+    left_bound = np.full(num_keys, -np.inf)
+    right_bound = np.full(num_keys, np.inf)
+    for j in range(key_index.shape[0]):
+        k = key_index[j]
+        left_bound[k] = max(left_bound[k], left[j])
+        right_bound[k] = min(right_bound[k], right[j])
+    return left_bound, right_bound
+
+
 def insert_srb_ancestors(samples, ts, show_progress=False):
     """
     Given the specified sample data file and final (unsimplified) tree sequence output
     by tsinfer, return a tree sequence with an ancestor inserted for each shared
     recombination breakpoint resulting from the sample edges. The returned tree
     sequence can be used as an ancestors tree sequence.
+
+    The show_progress argument is deprecated and has no effect.
     """
+    if show_progress:
+        warnings.warn(
+            "The show_progress argument to insert_srb_ancestors is deprecated "
+            "and has no effect",
+            FutureWarning,
+            stacklevel=2,
+        )
     logger.info("Starting srb ancestor insertion")
     tables = ts.dump_tables()
     edges = tables.edges
     # In lexsort the primary sort key is *last*
     index = np.lexsort((edges.left, edges.child))
     logger.info("Sorted edges")
-    flags = tables.nodes.flags
-
-    # Definitely possible to do this more efficiently with numpy, but may not be
-    # worth it.
-    srb_index = {}
-    last_edge = edges[index[0]]
-    progress = tqdm.tqdm(
-        total=len(edges) - 1, desc="scan edges", disable=not show_progress
+    left = edges.left[index]
+    right = edges.right[index]
+    parent = edges.parent[index]
+    child = edges.child[index]
+
+    # A shared recombination breakpoint occurs where two adjacent edges for the
+    # same sample abut. Each such pair is keyed by the breakpoint and the
+    # parents to the left and right of it.
+    is_srb = (
+        (tables.nodes.flags[child[1:]] == tskit.NODE_IS_SAMPLE)
+        & (child[1:] == child[:-1])
+        & (left[1:] == right[:-1])
     )
-    for j in index[1:]:
-        progress.update()
-        edge = edges[j]
-        condition = (
-            flags[edge.child] == tskit.NODE_IS_SAMPLE
-            and edge.child == last_edge.child
-            and edge.left == last_edge.right
-        )
-        if condition:
-            key = edge.left, last_edge.parent, edge.parent
-            if key in srb_index:
-                count, left_bound, right_bound = srb_index[key]
-                srb_index[key] = (
-                    count + 1,
-                    max(left_bound, last_edge.left),
-                    min(right_bound, edge.right),
-                )
-            else:
-                srb_index[key] = 1, last_edge.left, edge.right
-        last_edge = edge
-    progress.close()
+    keys = np.empty(
+        np.sum(is_srb), dtype=[("x", np.float64), ("pl", np.int32), ("pr", np.int32)]
+    )
+    keys["x"] = left[1:][is_srb]
+    keys["pl"] = parent[:-1][is_srb]
+    keys["pr"] = parent[1:][is_srb]
+    keys, first, inverse, count = np.unique(
+        keys, return_index=True, return_inverse=True, return_counts=True
+    )
+    inverse = inverse.reshape(-1)
+    left_bound, right_bound = _srb_bounds(
+        inverse, left[:-1][is_srb], right[1:][is_srb], keys.shape[0]
+    )
+    # Insert ancestors in the order in which their keys were first encountered
+    shared = np.where(count > 1)[0]
+    shared = shared[np.argsort(first[shared])]
 
-    logger.info(f"Built SRB map with {len(srb_index)} items")
+    logger.info(f"Built SRB map with {keys.shape[0]} items")
     tables, node_id_map = extract_ancestors(samples, ts)
     logger.info("Extracted ancestors ts")
     time = tables.nodes.time
 
-    num_extra = 0
-    progress = tqdm.tqdm(
-        total=len(srb_index), desc="scan index", disable=not show_progress
+    num_extra = shared.shape[0]
+    x = keys["x"][shared]
+    pl = node_id_map[keys["pl"][shared]]
+    pr = node_id_map[keys["pr"][shared]]
+    node = np.arange(num_extra, dtype=np.int32) + tables.nodes.num_rows
+    tables.nodes.append_columns(
+        flags=np.full(num_extra, constants.NODE_IS_SRB_ANCESTOR, dtype=np.uint32),
+        time=np.minimum(time[pl], time[pr]) - 1e-4,
+    )
+    # Each new node copies from pl to the left of the breakpoint and pr to the right.
+    edge_left = np.empty(2 * num_extra)
+    edge_left[0::2] = left_bound[shared]
+    edge_left[1::2] = x
+    edge_right = np.empty(2 * num_extra)
+    edge_right[0::2] = x
+    edge_right[1::2] = right_bound[shared]
+    edge_parent = np.empty(2 * num_extra, dtype=np.int32)
+    edge_parent[0::2] = pl
+    edge_parent[1::2] = pr
+    tables.edges.append_columns(
+        left=edge_left, right=edge_right, parent=edge_parent, child=np.repeat(node, 2)
     )
-    for k, v in srb_index.items():
-        progress.update()
-        if v[0] > 1:
-            left, right = v[1:]
-            x, pl, pr = k
-            pl = node_id_map[pl]
-            pr = node_id_map[pr]
-            t = min(time[pl], time[pr]) - 1e-4
-            node = tables.nodes.add_row(flags=constants.NODE_IS_SRB_ANCESTOR, time=t)
-            tables.edges.add_row(left, x, pl, node)
-            tables.edges.add_row(x, right, pr, node)
-            num_extra += 1
-    progress.close()
 
     logger.info(f"Generated {num_extra} extra ancestors")
-    tables.sort()
+    # Only the edges have changed since simplifying, so we don't need to sort
+    # the sites and mutations again. The new edges must be merged in with the
+    # existing ones, so we still need to sort the whole edge table.
+    tables.sort(
+        site_start=tables.sites.num_rows, mutation_start=tables.mutations.num_rows
+    )
     ancestors_ts = tables.tree_sequence()
     return ancestors_ts
 
@@ -723,7 +796,7 @@ def node_span(ts):
     of a sample. The span of all samples is therefore equal to the sequence length.
     """
     S = np.zeros(ts.num_nodes)
-    start = np.zeros(ts.num_nodes) - 1
+    start = np.full(ts.num_nodes, -1.0)
     iterator = zip(ts.edge_diffs(), ts.trees())
     for ((left, _), edges_out, edges_in), tree in iterator:
         for edge in edges_out:
@@ -769,7 +842,7 @@ def mean_sample_ancestry(ts, sample_sets, show_progress=False):
 
     K = len(sample_sets)
     A = np.zeros((K, ts.num_nodes))
-    parent = np.zeros(ts.num_nodes, dtype=int) - 1
+    parent = np.full(ts.num_nodes, -1, dtype=int)
     sample_count = np.zeros((K, ts.num_nodes), dtype=int)
     last_update = np.zeros(ts.num_nodes)
     total_length = np.zeros(ts.num_nodes)
@@ -849,7 +922,7 @@ def snip_centromere(ts, left, right):
         child=edges.child[index],
     )
     # Get all edges that intersect and add two edges for each.
-    index = np.logical_not(index)
+    index = ~index
     i_parent = edges.parent[index]
     i_child = edges.child[index]
     i_left = edges.left[index]
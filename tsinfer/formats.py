@@ -20,6 +20,8 @@
 Manage tsinfer's various file formats.
 """
 import collections.abc as abc
+import concurrent.futures
+import copy
 import datetime
 import functools
 import itertools
@@ -32,7 +34,6 @@ import threading
 import warnings
 
 import attr
-import dask.array as da
 import humanize
 import lmdb
 import numcodecs
@@ -75,6 +76,23 @@ def np_obj_equal(np_obj_array1, np_obj_array2):
     return all(itertools.starmap(np.array_equal, zip(np_obj_array1, np_obj_array2)))
 
 
+def np_ragged_equal(np_obj_array1, np_obj_array2):
+    """
+    Equivalent to np_obj_equal for object arrays in which every item is a 1D
+    numeric array, such as focal sites and locations. The item lengths and
+    the concatenated values are compared in bulk rather than item by item.
+    """
+    if np_obj_array1.shape != np_obj_array2.shape:
+        return False
+    if np_obj_array1.size == 0:
+        return True
+    lengths1 = np.fromiter(map(len, np_obj_array1), dtype=np.int64)
+    lengths2 = np.fromiter(map(len, np_obj_array2), dtype=np.int64)
+    return np.array_equal(lengths1, lengths2) and np.array_equal(
+        np.concatenate(np_obj_array1), np.concatenate(np_obj_array2)
+    )
+
+
 def exclude_id(attribute, value):
     """
     Used to filter out the id field from attrs objects such as Ancestor
@@ -133,32 +151,29 @@ class BufferedItemWriter:
                     raise ValueError("Chunk sizes must be equal")
 
         self.arrays = array_map
+        self.first_key = next(iter(array_map))
         if num_threads <= 0:
             # Use a syncronous algorithm.
             self.num_threads = 0
             self.num_buffers = 1
         else:
-            # One buffer for each thread. Buffers are referred to by their indexes.
-            self.num_buffers = num_threads
+            # One buffer for each flush thread plus one for the producer, so
+            # that filling the next buffer overlaps with flushing the last one.
+            # Buffers are referred to by their indexes.
+            self.num_buffers = num_threads + 1
             self.num_threads = num_threads
         self.buffers = {}
+        self.buffer_shapes = {}
         self.current_size = 0
         self.total_items = 0
         for key, array in self.arrays.items():
+            # Buffers are allocated when first written to, so that writers
+            # which only ever fill a few items don't pay for all of them.
             self.buffers[key] = [None for _ in range(self.num_buffers)]
-            np_array = array[:]
             shape = list(array.shape)
             chunked_dimension = 1 if "full_haplotype" in key else 0
             shape[chunked_dimension] = self.chunk_size
-            for j in range(self.num_buffers):
-                self.buffers[key][j] = np.empty_like(np_array)
-                self.buffers[key][j].resize(*shape)
-                # We need to initialise the buffers for the arrays where only the extent
-                # of the ancestor is written
-                if key == "full_haplotype":
-                    self.buffers[key][j][...] = MISSING_DATA
-                elif key == "full_haplotype_mask":
-                    self.buffers[key][j][...] = True
+            self.buffer_shapes[key] = tuple(shape)
 
             # Make sure the destination array is zero sized at the start.
             shape[chunked_dimension] = 0
@@ -192,6 +207,31 @@ class BufferedItemWriter:
             ]
             logger.info(f"Started {self.num_threads} flush worker threads")
 
+    def _alloc_buffer(self, buffer_index):
+        for key, array in self.arrays.items():
+            # Plain numpy buffers; the data is only encoded when the buffer
+            # is written to the destination array.
+            buffer = np.empty(self.buffer_shapes[key], dtype=array.dtype)
+            # We need to initialise the buffers for the arrays where only the extent
+            # of the ancestor is written
+            if key == "full_haplotype":
+                buffer[...] = MISSING_DATA
+            elif key == "full_haplotype_mask":
+                buffer[...] = True
+            self.buffers[key][buffer_index] = buffer
+
+    def _next_offset(self):
+        """
+        Returns the offset of the next item in the current write buffer,
+        flushing the buffer first if it is full and allocating the write
+        buffer if it has not been used before.
+        """
+        if self.num_buffered_items[self.write_buffer] == self.chunk_size:
+            self._queue_flush_buffer()
+        if self.buffers[self.first_key][self.write_buffer] is None:
+            self._alloc_buffer(self.write_buffer)
+        return self.num_buffered_items[self.write_buffer]
+
     def _commit_write_buffer(self, write_buffer):
         start = self.start_offset[write_buffer]
         n = self.num_buffered_items[write_buffer]
@@ -256,9 +296,7 @@ class BufferedItemWriter:
         function correspond to the keys in the dictionary of arrays provided
         to the constructor.
         """
-        if self.num_buffered_items[self.write_buffer] == self.chunk_size:
-            self._queue_flush_buffer()
-        offset = self.num_buffered_items[self.write_buffer]
+        offset = self._next_offset()
         for key, value in kwargs.items():
             # Here we have to special case the haplotype for performance
             # reasons, as writing the full haplotype is expensive.
@@ -277,6 +315,43 @@ class BufferedItemWriter:
         self.total_items += 1
         return self.total_items - 1
 
+    def reserve(self, key):
+        """
+        Returns a writable view of the next item's slot in the buffer for the
+        specified array, so that its value can be written in place. The item
+        is completed by the next call to ``add``, which must omit this key.
+        """
+        offset = self._next_offset()
+        return self.buffers[key][self.write_buffer][offset]
+
+    def add_batch(self, **kwargs):
+        """
+        Add a batch of items to each of the arrays. Each keyword argument
+        must be an array whose first dimension is the number of items to
+        add; rows are copied into the buffers with one slice assignment per
+        array and buffer, rather than one assignment per item. The haplotype
+        arrays are not supported. Returns the ID of the first item added.
+        """
+        num_items = -1
+        for value in kwargs.values():
+            if num_items == -1:
+                num_items = len(value)
+            elif len(value) != num_items:
+                raise ValueError("Batch arrays must have equal length")
+        first_item = self.total_items
+        j = 0
+        while j < num_items:
+            offset = self._next_offset()
+            n = min(self.chunk_size - offset, num_items - j)
+            for key, value in kwargs.items():
+                self.buffers[key][self.write_buffer][offset : offset + n] = value[
+                    j : j + n
+                ]
+            self.num_buffered_items[self.write_buffer] += n
+            self.total_items += n
+            j += n
+        return first_item
+
     def flush(self):
         """
         Flush the remaining items to the destination arrays and return all
@@ -504,6 +579,21 @@ class DataContainer:
         self.data = zarr.open(store=store, mode="r")
         self._check_format()
         self._mode = self.READ_MODE
+        self._decoded_arrays = {}
+
+    def _read_array(self, name):
+        """
+        Returns the decoded values of the array property with the specified
+        name. The data cannot change in read mode, so the values are decoded
+        once and cached as a read-only numpy array.
+        """
+        if self._mode != self.READ_MODE:
+            return getattr(self, name)[:]
+        if name not in self._decoded_arrays:
+            values = getattr(self, name)[:]
+            values.flags.writeable = False
+            self._decoded_arrays[name] = values
+        return self._decoded_arrays[name]
 
     def _new_lmdb_store(self, map_size=None):
         if os.path.exists(self.path):
@@ -591,17 +681,20 @@ class DataContainer:
         self.data.attrs[FINALISED_KEY] = True
         if self.path is not None:
             store = self.data.store
-            store.close()
             logger.debug("Fixing up LMDB file size")
-            with lmdb.open(self.path, subdir=False, lock=False, writemap=True) as db:
-                # LMDB maps a very large amount of space by default. While this
-                # doesn't do any harm, it's annoying because we can't use ls to
-                # see the file sizes and the amount of RAM we're mapping can
-                # look like it's very large. So, we fix this up so that the
-                # map size is equal to the number of pages in use.
-                num_pages = db.info()["last_pgno"]
-                page_size = db.stat()["psize"]
-                db.set_mapsize(num_pages * page_size)
+            # LMDB maps a very large amount of space by default. While this
+            # doesn't do any harm, it's annoying because we can't use ls to
+            # see the file sizes and the amount of RAM we're mapping can
+            # look like it's very large. So, we fix this up so that the
+            # map size is equal to the number of pages in use. This is done
+            # through the store's own environment, to avoid reopening and
+            # remapping the file just to resize it.
+            db = store.db
+            db.sync(True)
+            num_pages = db.info()["last_pgno"]
+            page_size = db.stat()["psize"]
+            db.set_mapsize(num_pages * page_size)
+            store.close()
             # Remove the lock file as we don't need it after this point.
             remove_lmdb_lockfile(self.path)
         self._open_readonly()
@@ -1350,7 +1443,7 @@ class SampleData(DataContainer):
             and np_obj_equal(
                 self.individuals_metadata[:], other.individuals_metadata[:]
             )
-            and np_obj_equal(
+            and np_ragged_equal(
                 self.individuals_location[:], other.individuals_location[:]
             )
         )
@@ -1776,12 +1869,10 @@ class SampleData(DataContainer):
             population=population,
             flags=flags,
         )
-        sample_ids = []
-        for _ in range(ploidy):
-            sid = self._samples_writer.add(
-                individual=individual_id,
-            )
-            sample_ids.append(sid)
+        first_sample = self._samples_writer.add_batch(
+            individual=np.full(ploidy, individual_id, dtype=np.int32)
+        )
+        sample_ids = list(range(first_sample, first_sample + ploidy))
         return individual_id, sample_ids
 
     def add_site(
@@ -1858,7 +1949,9 @@ class SampleData(DataContainer):
         :return: The ID of the newly added site.
         :rtype: int
         """
-        genotypes = tskit.util.safe_np_int_cast(genotypes, dtype=np.int8)
+        genotypes = np.asarray(genotypes)
+        if genotypes.dtype.kind not in "iu":
+            genotypes = tskit.util.safe_np_int_cast(genotypes, dtype=np.int8)
         self._check_build_mode()
         if self._build_state == self.ADDING_POPULATIONS:
             if genotypes.shape[0] == 0:
@@ -1876,25 +1969,36 @@ class SampleData(DataContainer):
             self._alloc_site_writer()
             self._build_state = self.ADDING_SITES
             self._last_position = -1
+            # Both are fixed from here on; avoid reopening the zarr array and
+            # decoding the attrs for every site added.
+            self._site_num_samples = self.num_samples
+            self._site_sequence_length = self.sequence_length
         assert self._build_state == self.ADDING_SITES
 
         if alleles is None:
             alleles = ["0", "1"]
         n_alleles = len(alleles)
-        non_missing = genotypes != MISSING_DATA
         if len(set(alleles)) != n_alleles:
             raise ValueError("Alleles must be distinct")
         if n_alleles > 64:
             # This is mandated by tskit's map_mutations function.
             raise ValueError("Cannot have more than 64 alleles")
-        if np.any(genotypes == MISSING_DATA) and alleles[-1] is not None:
+        # All the genotype checks below follow from the smallest and largest
+        # values, so we make two reductions rather than a scan per check.
+        min_genotype = genotypes.min() if genotypes.size > 0 else 0
+        max_genotype = genotypes.max() if genotypes.size > 0 else 0
+        if min_genotype < -128 or max_genotype > 127:
+            raise OverflowError("Cannot convert safely to int8 type")
+        if min_genotype == MISSING_DATA and alleles[-1] is not None:
             # Don't modify the input parameter
             alleles = list(alleles) + [None]
-        if np.any(np.logical_and(genotypes < 0, genotypes != MISSING_DATA)):
+        if min_genotype < MISSING_DATA:
             raise ValueError("Non-missing values for genotypes cannot be negative")
-        if genotypes.shape != (self.num_samples,):
-            raise ValueError(f"Must have {self.num_samples} (num_samples) genotypes.")
-        if np.any(genotypes[non_missing] >= n_alleles):
+        if genotypes.shape != (self._site_num_samples,):
+            raise ValueError(
+                f"Must have {self._site_num_samples} (num_samples) genotypes."
+            )
+        if max_genotype >= n_alleles:
             raise ValueError("Non-missing values for genotypes must be < num alleles")
         if ancestral_allele is None:
             ancestral_allele = 0
@@ -1906,7 +2010,8 @@ class SampleData(DataContainer):
                 )
         if position < 0:
             raise ValueError("Site position must be > 0")
-        if self.sequence_length > 0 and position >= self.sequence_length:
+        sequence_length = self._site_sequence_length
+        if sequence_length > 0 and position >= sequence_length:
             raise ValueError("Site position must be less than the sequence length")
         if position <= self._last_position:
             raise ValueError(
@@ -1919,9 +2024,11 @@ class SampleData(DataContainer):
             )
         if time is None:
             time = tskit.UNKNOWN_TIME
+        # The genotypes are known to fit in an int8, so we cast them straight
+        # into the writer's buffer rather than through an intermediate copy.
+        np.copyto(self._sites_writer.reserve("genotypes"), genotypes, casting="unsafe")
         site_id = self._sites_writer.add(
             position=position,
-            genotypes=genotypes,
             metadata=self._check_metadata(metadata),
             alleles=alleles,
             time=time,
@@ -2168,22 +2275,54 @@ class SampleData(DataContainer):
         # the chunk iterator to handle this.
         if recode_ancestral is None:
             recode_ancestral = False
-        aa_index = self.sites_ancestral_allele[:]
-        # If ancestral allele is missing, keep the order unchanged (aa_index of zero)
-        aa_index[aa_index == MISSING_DATA] = 0
+        if recode_ancestral:
+            aa_index = self.sites_ancestral_allele[:]
+            # If ancestral allele is missing, keep the order unchanged (aa_index of
+            # zero)
+            aa_index[aa_index == MISSING_DATA] = 0
+            if sites is not None:
+                aa_index = aa_index[sites]
+            aa_index = aa_index[:, np.newaxis]
         chunk_size = self.sites_genotypes.chunks[1]
-        for j in range(self.num_samples):
-            if j % chunk_size == 0:
-                chunk = self.sites_genotypes[:, j : j + chunk_size].T
-            a = chunk[j % chunk_size]
+        num_samples = self.num_samples
+
+        def read_chunk(start):
+            # Subset, recode and transpose a whole chunk of samples at a time, so
+            # that each haplotype is yielded as a contiguous row of the chunk.
+            chunk = self.sites_genotypes[:, start : start + chunk_size]
+            if sites is not None:
+                chunk = chunk[sites]
             if recode_ancestral:
                 # Remap the genotypes at all sites, depending on the aa_index
-                a = np.where(
-                    a == aa_index,
+                chunk = np.where(
+                    chunk == aa_index,
                     0,
-                    np.where(np.logical_and(a != MISSING_DATA, a < aa_index), a + 1, a),
+                    np.where(
+                        np.logical_and(chunk != MISSING_DATA, chunk < aa_index),
+                        chunk + 1,
+                        chunk,
+                    ),
                 )
-            yield j, a if sites is None else a[sites]
+            return np.ascontiguousarray(chunk.T)
+
+        if num_samples <= chunk_size:
+            # There is only one chunk, so there is nothing to read ahead.
+            for k, a in enumerate(read_chunk(0)):
+                yield k, a
+            return
+        # Once the caller has taken the first row of a chunk, read the next chunk
+        # in the background so that decompression overlaps with the caller.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            chunk = read_chunk(0)
+            for start in range(0, num_samples, chunk_size):
+                next_start = start + chunk_size
+                future = None
+                for k, a in enumerate(chunk):
+                    yield start + k, a
+                    if k == 0 and next_start < num_samples:
+                        future = executor.submit(read_chunk, next_start)
+                if future is not None:
+                    chunk = future.result()
 
     def haplotypes(self, samples=None, sites=None, recode_ancestral=None):
         """
@@ -2228,17 +2367,18 @@ class SampleData(DataContainer):
 
     def individual(self, id_):
         # TODO document
-        samples = np.where(self.samples_individual[:] == id_)[0]
+        samples = np.where(self._read_array("samples_individual") == id_)[0]
         # Make sure the numpy arrays are converted to lists so that
         # we can compare individuals using ==
         return Individual(
             id_,
-            location=list(self.individuals_location[id_]),
-            metadata=self.individuals_metadata[id_],
-            time=self.individuals_time[id_],
-            population=self.individuals_population[id_],
+            location=list(self._read_array("individuals_location")[id_]),
+            # The cached metadata is shared between calls, so hand out a copy.
+            metadata=copy.deepcopy(self._read_array("individuals_metadata")[id_]),
+            time=self._read_array("individuals_time")[id_],
+            population=self._read_array("individuals_population")[id_],
             samples=list(samples),
-            flags=self.individuals_flags[id_],
+            flags=self._read_array("individuals_flags")[id_],
         )
 
     def individuals(self):
@@ -2268,7 +2408,7 @@ class SampleData(DataContainer):
         # TODO document
         return Sample(
             id_,
-            individual=self.samples_individual[id_],
+            individual=self._read_array("samples_individual")[id_],
         )
 
     def samples(self):
@@ -2298,8 +2438,10 @@ class SgkitSampleData(SampleData):
         self.data = zarr.open(path, mode="r")
         genotypes_arr = self.data["call_genotype"]
         _, self._num_individuals, self.ploidy = genotypes_arr.shape
-        self._num_sites = np.sum(self.sites_mask)
+        self._num_sites = np.count_nonzero(self.sites_mask)
         self._num_samples = self._num_individuals * self.ploidy
+        self._mode = self.READ_MODE
+        self._decoded_arrays = {}
 
         assert self.ploidy == self.data["call_genotype"].chunks[2]
         if self.ploidy > 1:
@@ -2368,8 +2510,10 @@ class SgkitSampleData(SampleData):
     def sites_alleles(self):
         return self.data["variant_allele"][:][self.sites_mask]
 
-    @property
+    @functools.cached_property
     def sites_mask(self):
+        # The mask is used to index most of the site arrays, so we decode and
+        # validate it once rather than on every access.
         try:
             if (
                 self.data["variant_mask"].shape[0]
@@ -2381,12 +2525,12 @@ class SgkitSampleData(SampleData):
             # Often xarray will save a bool array as int8, so we need to cast,
             # but check that a mistake hasn't been made by checking
             # that the values are either 0 or 1
-            mask = self.data["variant_mask"].astype(np.int8)
-            if da.max(mask).compute() > 1 or da.min(mask).compute() < 0:
+            mask = self.data["variant_mask"][:]
+            if mask.size > 0 and (mask.max() > 1 or mask.min() < 0):
                 raise ValueError(
                     "The variant_mask array contains values other than 0 or 1"
                 )
-            return self.data["variant_mask"].astype(bool)
+            return mask.astype(bool)
         except KeyError:
             return np.full(self.data["variant_position"].shape, True, dtype=bool)
 
@@ -2597,9 +2741,11 @@ class SgkitSampleData(SampleData):
         # the chunk iterator to handle this.
         if recode_ancestral is None:
             recode_ancestral = False
-        aa_index = self.sites_ancestral_allele[:]
-        # If ancestral allele is missing, keep the order unchanged (aa_index of zero)
-        aa_index[aa_index == MISSING_DATA] = 0
+        if recode_ancestral:
+            aa_index = self.sites_ancestral_allele[:]
+            # If ancestral allele is missing, keep the order unchanged (aa_index of
+            # zero)
+            aa_index[aa_index == MISSING_DATA] = 0
         gt = self.data["call_genotype"]
         chunk_size = gt.chunks[1]
         for j in range(self.num_individuals):
@@ -2822,15 +2968,28 @@ class AncestorData(DataContainer):
             and np.array_equal(self.ancestors_start[:], other.ancestors_start[:])
             and np.array_equal(self.ancestors_end[:], other.ancestors_end[:])
             # Need to take a different approach with np object arrays.
-            and np_obj_equal(
+            and np_ragged_equal(
                 self.ancestors_focal_sites[:], other.ancestors_focal_sites[:]
             )
-            # TODO For large sets of ancestors, this needs to be done chunk-wise
-            and np_obj_equal(
-                self.ancestors_full_haplotype[:], other.ancestors_full_haplotype[:]
+            and all(
+                np.array_equal(haps_self, haps_other)
+                for haps_self, haps_other in self._haplotype_blocks(other)
             )
         )
 
+    def _haplotype_blocks(self, other):
+        """
+        Iterate over corresponding blocks of ancestors in the full haplotype arrays
+        of this and the other AncestorData, one chunk of ancestors at a time, so
+        that we never hold the full haplotype matrices in memory.
+        """
+        step = self.ancestors_full_haplotype.chunks[1]
+        for j in range(0, self.num_ancestors, step):
+            yield (
+                self.ancestors_full_haplotype[:, j : j + step],
+                other.ancestors_full_haplotype[:, j : j + step],
+            )
+
     def assert_data_equal(self, other):
         if self.data_equal(other):
             return
@@ -2847,10 +3006,8 @@ class AncestorData(DataContainer):
         assert len(fc_self) == len(fc_other)
         for sites_self, sites_other in zip(fc_self, fc_other):
             np.testing.assert_array_equal(sites_self, sites_other)
-        haps_self = self.ancestors_full_haplotype[:]
-        haps_other = other.ancestors_full_haplotype[:]
-        for hap_self, hap_other in zip(haps_self, haps_other):
-            np.testing.assert_array_equal(hap_self.T, hap_other.T)
+        for haps_self, haps_other in self._haplotype_blocks(other):
+            np.testing.assert_array_equal(haps_self, haps_other)
         # Put this assert last to have an easy to change attribute so we can
         # test this function.
         assert self.sequence_length == other.sequence_length
@@ -3278,7 +3435,9 @@ class AncestorData(DataContainer):
         order, with the oldest first. The id of the added ancestor is returned.
         """
         self._check_build_mode()
-        haplotype = tskit.util.safe_np_int_cast(haplotype, dtype=np.int8, copy=True)
+        # The haplotype is copied into the writer's buffer, so we only need our
+        # own copy of the focal sites, which are buffered by reference.
+        haplotype = tskit.util.safe_np_int_cast(haplotype, dtype=np.int8)
         focal_sites = tskit.util.safe_np_int_cast(
             focal_sites, dtype=np.int32, copy=True
         )
@@ -3290,7 +3449,9 @@ class AncestorData(DataContainer):
             raise ValueError("start must be < end")
         if haplotype.shape != (end - start,):
             raise ValueError("haplotypes incorrect shape.")
-        if np.any(focal_sites < start) or np.any(focal_sites >= end):
+        if focal_sites.size > 0 and (
+            focal_sites.min() < start or focal_sites.max() >= end
+        ):
             raise ValueError("focal sites must be between start and end")
         if time <= 0:
             raise ValueError("time must be > 0")
@@ -3348,10 +3509,10 @@ class AncestorData(DataContainer):
         """
         return Ancestor(
             id=id_,
-            start=self.ancestors_start[id_],
-            end=self.ancestors_end[id_],
-            time=self.ancestors_time[id_],
-            focal_sites=self.ancestors_focal_sites[id_],
+            start=self._read_array("ancestors_start")[id_],
+            end=self._read_array("ancestors_end")[id_],
+            time=self._read_array("ancestors_time")[id_],
+            focal_sites=self._read_array("ancestors_focal_sites")[id_].copy(),
             full_haplotype=self.ancestors_full_haplotype[:, id_, 0],
         )
 
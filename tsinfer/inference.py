@@ -22,6 +22,7 @@ of the core tasks like ancestor generation and matching are delegated
 to other modules.
 """
 import collections
+import concurrent.futures
 import copy
 import dataclasses
 import heapq
@@ -117,7 +118,7 @@ def count_pc_ancestors(flags):
     NODE_IS_PC_ANCESTOR set.
     """
     flags = np.array(flags, dtype=np.uint32, copy=False)
-    return np.sum(is_pc_ancestor(flags))
+    return np.count_nonzero(flags & constants.NODE_IS_PC_ANCESTOR)
 
 
 def count_srb_ancestors(flags):
@@ -126,7 +127,7 @@ def count_srb_ancestors(flags):
     NODE_IS_SRB_ANCESTOR set.
     """
     flags = np.array(flags, dtype=np.uint32, copy=False)
-    return np.sum(np.bitwise_and(flags, constants.NODE_IS_SRB_ANCESTOR) != 0)
+    return np.count_nonzero(flags & constants.NODE_IS_SRB_ANCESTOR)
 
 
 AlleleCounts = collections.namedtuple("AlleleCounts", "known ancestral derived")
@@ -136,8 +137,8 @@ def allele_counts(genotypes):
     """
     Return summary counts of the number of different allele types for a genotypes array
     """
-    n_known = np.sum(genotypes != tskit.MISSING_DATA)
-    n_ancestral = np.sum(genotypes == 0)
+    n_known = np.count_nonzero(genotypes != tskit.MISSING_DATA)
+    n_ancestral = np.count_nonzero(genotypes == 0)
     return AlleleCounts(
         known=n_known, ancestral=n_ancestral, derived=n_known - n_ancestral
     )
@@ -1587,44 +1588,55 @@ class AncestorMatcher(Matcher):
             )
             return result
 
-        for group, ancestor_ids in self.ancestor_grouping.items():
-            self.__start_group(group, ancestor_ids)
-            if self.num_threads > 0:
-                mapper = lambda func, args: threads.threaded_map(  # noqa E731
-                    func, args, self.num_threads
-                )
-            else:
-                mapper = map
-
-            key = (
-                f"{group}_{hash(tuple(ancestor_ids))}_"
-                f"{self.__class__.__name__}".encode()
+        # Use a single pool for all groups, so that each worker thread keeps its
+        # matcher instance rather than allocating a new one for every group.
+        executor = None
+        mapper = map
+        if self.num_threads > 0:
+            executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.num_threads
             )
-            results = None
-            if self.resume_lmdb is not None:
-                with self.resume_lmdb.begin() as txn:
-                    cached_results = txn.get(key)
-
-                if cached_results is not None:
-                    results = pickle.loads(cached_results)
-
-            if results is None:
-                # We have to consume the result iterator here, otherwise we'll match
-                # against ancestors in this epoch
-                results = []
-                for result in mapper(
-                    worker_function, self.ancestor_data.ancestors(indexes=ancestor_ids)
-                ):
-                    results.append(result)
-                    self.match_progress.update()
-                if self.resume_lmdb is not None:
-                    with self.resume_lmdb.begin(write=True) as txn:
-                        txn.put(
-                            key,
-                            pickle.dumps(results),
-                        )
+            mapper = lambda func, args: threads.threaded_map(  # noqa E731
+                func, args, self.num_threads, executor=executor
+            )
+
+        try:
+            for group, ancestor_ids in self.ancestor_grouping.items():
+                self.__start_group(group, ancestor_ids)
 
-            self.__complete_group(group, ancestor_ids, results)
+                key = (
+                    f"{group}_{hash(tuple(ancestor_ids))}_"
+                    f"{self.__class__.__name__}".encode()
+                )
+                results = None
+                if self.resume_lmdb is not None:
+                    with self.resume_lmdb.begin() as txn:
+                        cached_results = txn.get(key)
+
+                    if cached_results is not None:
+                        results = pickle.loads(cached_results)
+
+                if results is None:
+                    # We have to consume the result iterator here, otherwise we'll match
+                    # against ancestors in this epoch
+                    results = []
+                    for result in mapper(
+                        worker_function,
+                        self.ancestor_data.ancestors(indexes=ancestor_ids),
+                    ):
+                        results.append(result)
+                        self.match_progress.update()
+                    if self.resume_lmdb is not None:
+                        with self.resume_lmdb.begin(write=True) as txn:
+                            txn.put(
+                                key,
+                                pickle.dumps(results),
+                            )
+
+                self.__complete_group(group, ancestor_ids, results)
+        finally:
+            if executor is not None:
+                executor.shutdown()
 
         ts = self.store_output()
         self.match_progress.close()
@@ -2001,7 +2013,11 @@ class SampleMatcher(Matcher):
             ts = insert_missing_sites(
                 self.sample_data,
                 ts,
-                sample_id_map=np.array(list(self.sample_id_map.keys())),
+                sample_id_map=np.fromiter(
+                    self.sample_id_map.keys(),
+                    dtype=np.int32,
+                    count=len(self.sample_id_map),
+                ),
                 progress_monitor=self.progress_monitor,
             )
         else:
@@ -49,49 +49,62 @@ except ImportError:
 logger = logging.getLogger(__name__)
 
 
-def threaded_map(func, args, num_workers):
-    results_buffer = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
-        futures = set()
-        next_index = 0
-        for i, arg in enumerate(args):
-            # +1 so that we're not waiting for the args generator to produce the next arg
-            while len(futures) >= num_workers + 1:
-                # If there are too many in-progress tasks, wait for one to complete
-                done, futures = concurrent.futures.wait(
-                    futures, return_when=concurrent.futures.FIRST_COMPLETED
-                )
-                for future in done:
-                    index, result = future.result()
-                    if index == next_index:
-                        # If this result is the next expected one, yield it immediately
-                        yield result
-                        next_index += 1
-                    else:
-                        heapq.heappush(results_buffer, (index, result))
-
-                    # Yield any results from the buffer that are next in line
-                    while results_buffer and results_buffer[0][0] == next_index:
-                        _, result = heapq.heappop(results_buffer)
-                        yield result
-                        next_index += 1
-
-            # Wraps the function so we can track the index of the argument
-            futures.add(executor.submit(lambda arg, i=i: (i, func(arg)), arg))
-
-        concurrent.futures.wait(futures)
-        for future in futures:
-            index, result = future.result()
-            if index == next_index:
-                yield result
-                next_index += 1
-            else:
-                heapq.heappush(results_buffer, (index, result))
+def threaded_map(func, args, num_workers, executor=None):
+    """
+    Returns an iterator over func applied to each of the args, evaluated in a
+    pool of num_workers threads and yielded in order. If an executor is
+    provided its threads are reused (so that any thread-local state persists
+    between calls) rather than creating and tearing down a new pool.
+    """
+    if executor is None:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
+            yield from _threaded_map(func, args, num_workers, executor)
+    else:
+        yield from _threaded_map(func, args, num_workers, executor)
+
 
-        # Yield any remaining results in the buffer
-        while results_buffer:
-            _, result = heapq.heappop(results_buffer)
+def _threaded_map(func, args, num_workers, executor):
+    results_buffer = []
+    futures = set()
+    next_index = 0
+    for i, arg in enumerate(args):
+        # +1 so that we're not waiting for the args generator to produce the next arg
+        while len(futures) >= num_workers + 1:
+            # If there are too many in-progress tasks, wait for one to complete
+            done, futures = concurrent.futures.wait(
+                futures, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                index, result = future.result()
+                if index == next_index:
+                    # If this result is the next expected one, yield it immediately
+                    yield result
+                    next_index += 1
+                else:
+                    heapq.heappush(results_buffer, (index, result))
+
+                # Yield any results from the buffer that are next in line
+                while results_buffer and results_buffer[0][0] == next_index:
+                    _, result = heapq.heappop(results_buffer)
+                    yield result
+                    next_index += 1
+
+        # Wraps the function so we can track the index of the argument
+        futures.add(executor.submit(lambda arg, i=i: (i, func(arg)), arg))
+
+    concurrent.futures.wait(futures)
+    for future in futures:
+        index, result = future.result()
+        if index == next_index:
             yield result
+            next_index += 1
+        else:
+            heapq.heappush(results_buffer, (index, result))
+
+    # Yield any remaining results in the buffer
+    while results_buffer:
+        _, result = heapq.heappop(results_buffer)
+        yield result
 
 
 def _queue_thread(worker, work_queue, name="tsinfer-worker", index=0, consumer=True):
@@ -200,9 +200,8 @@ class Visualiser:
         self, original_ts, sample_data, ancestor_data, inferred_ts, box_size=8
     ):
         # Make sure the singletons have been removed.
-        for v in original_ts.variants():
-            if np.sum(v.genotypes) < 2:
-                raise ValueError("Only non singletons will be considered")
+        if np.any(np.sum(original_ts.genotype_matrix(), axis=1) < 2):
+            raise ValueError("Only non singletons will be considered")
         self.box_size = box_size
         self.sample_data = sample_data
         self.original_ts = original_ts
@@ -228,8 +227,7 @@ class Visualiser:
         # y coordinates. Breaking up into samples and ancestors is awkward.
 
         # Find the site indexes for the true breakpoints
-        breakpoints = list(original_ts.breakpoints())
-        self.true_breakpoints = breakpoints[1:-1]
+        self.true_breakpoints = original_ts.breakpoints(as_array=True)[1:-1]
 
         self.top_padding = box_size
         self.left_padding = box_size
@@ -284,9 +282,10 @@ class Visualiser:
 
         b = self.box_size
         origin = self.haplotype_origin
-        self.x_coordinate_map = {
-            site.position: origin[0] + site.id * b for site in original_ts.sites()
-        }
+        position = original_ts.tables.sites.position
+        self.x_coordinate_map = dict(
+            zip(position.tolist(), range(origin[0], origin[0] + len(position) * b, b))
+        )
         self.draw_base()
 
     def draw_base(self):
@@ -311,12 +310,10 @@ class Visualiser:
         b = self.box_size
         origin = self.haplotype_origin
         coordinates = sorted(self.x_coordinate_map.keys())
-        for bp in self.true_breakpoints:
-            # Find the smallest coordinate > position
-            for position in coordinates:
-                if position >= bp:
-                    break
-            x = self.x_coordinate_map[position]
+        # Find the smallest coordinate >= each breakpoint
+        index = np.searchsorted(coordinates, self.true_breakpoints)
+        for j in np.minimum(index, len(coordinates) - 1):
+            x = self.x_coordinate_map[coordinates[j]]
             y1 = origin[0] + self.row_map[0] * b
             y2 = origin[1] + (self.row_map[len(self.row_map) - 1] + 1) * b
             draw.line([(x, y1), (x, y2)], fill="purple", width=3)
@@ -396,12 +393,10 @@ class Visualiser:
 
     def draw_copying_paths(self, pattern):
         N = self.num_ancestors + self.samples.shape[0]
-        P = np.zeros((N, self.num_sites), dtype=int) - 1
+        P = np.full((N, self.num_sites), -1, dtype=int)
         ts = self.inferred_ts
-        site_index = {}
-        sites = list(ts.sites())
-        for site in ts.sites():
-            site_index[site.position] = site.id
+        position = ts.tables.sites.position
+        site_index = dict(zip(position.tolist(), range(ts.num_sites)))
         site_index[ts.sequence_length] = ts.num_sites
         site_index[0] = 0
         for e in ts.edges():
@@ -413,7 +408,7 @@ class Visualiser:
         breakpoints = []
         for j in range(1, self.num_ancestors + n):
             for k in np.where(P[j][1:] != P[j][:-1])[0]:
-                breakpoints.append(sites[k + 1].position)
+                breakpoints.append(position[k + 1])
             self.draw_copying_path(pattern.format(j - 1), j, P[j], breakpoints)
 
 